@@ -0,0 +1,200 @@
+import os
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from models import db, AnalysisJob
+from analysis_service import run_analysis, AnalysisError
+from cluster_tracks import classify_track_multi
+from analysis_tiers import DEFAULT_TIER
+from analysis_locks import analysis_run_lock, analysis_job_lock
+
+ACTIVE_STATES = ("queued", "running")
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "1"))
+FINISHED_JOB_TTL = timedelta(days=1)
+# Через скільки секунд знову пробувати задачу, якщо той самий альбом/плейлист зараз
+# аналізує інша задача чи фоновий перерахунок
+ANALYSIS_JOB_RETRY_SEC = float(os.getenv("ANALYSIS_JOB_RETRY_SEC", "5"))
+
+_executor = ThreadPoolExecutor(max_workers=ANALYSIS_JOB_WORKERS, thread_name_prefix="analysis-job")
+_app = None
+
+
+def _slim_track(track):
+    # Зберігаємо лише те, що потрібно для аналізу, а не весь об'єкт Spotify
+    return {
+        "id": track["id"],
+        "name": track["name"],
+        "artists": [{"name": artist["name"]} for artist in track["artists"]],
+        "popularity": track.get("popularity", 0),
+    }
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "target_id": job.target_id,
+        "tier": job.tier,
+        "state": job.state,
+        "progress": {
+            "done": job.progress_done,
+            "total": job.progress_total,
+            "tracks": json.loads(job.progress) if job.progress else [],
+        },
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+    }
+
+
+def init_analysis_jobs(app):
+    """
+    Прив'язує фоновий виконавець до застосунку, прибирає старі завершені задачі
+    і повертає в чергу ті, що не завершились до перезапуску воркера.
+    Задачі, які зараз виконує інший живий воркер (лок задачі зайнятий), не чіпаємо.
+    """
+    global _app
+    _app = app
+
+    with app.app_context():
+        AnalysisJob.query.filter(
+            AnalysisJob.state.notin_(ACTIVE_STATES),
+            AnalysisJob.updated_at < datetime.now(timezone.utc) - FINISHED_JOB_TTL
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+        resumed = []
+        for job in AnalysisJob.query.filter(AnalysisJob.state.in_(ACTIVE_STATES)).all():
+            with analysis_job_lock(job.id) as acquired:
+                if not acquired:
+                    continue
+                # Воркер, що виконував задачу, зупинився, не завершивши її
+                # (умова на стан — задача могла завершитися між вибіркою і локом)
+                AnalysisJob.query.filter_by(id=job.id, state="running").update(
+                    {"state": "queued"}, synchronize_session=False
+                )
+                db.session.commit()
+            resumed.append(job)
+
+        for job in resumed:
+            print(f"🔁 [INFO] Resuming analysis job {job.id} for {job.kind} {job.target_id}")
+            _executor.submit(_run_job, job.id)
+
+
+def find_active_job(kind, target_id, tier=DEFAULT_TIER):
+    return (
+        AnalysisJob.query
+        .filter_by(kind=kind, target_id=target_id, tier=tier)
+        .filter(AnalysisJob.state.in_(ACTIVE_STATES))
+        .order_by(AnalysisJob.created_at.desc())
+        .first()
+    )
+
+
+def submit_analysis_job(kind, target_id, tracks, snapshot_id=None, tier=DEFAULT_TIER):
+    tracks = [_slim_track(track) for track in tracks]
+    job = AnalysisJob(
+        id=str(uuid.uuid4()),
+        kind=kind,
+        target_id=target_id,
+        state="queued",
+        tracks=json.dumps(tracks),
+        snapshot_id=snapshot_id,
+        tier=tier,
+        progress_total=len(tracks),
+        progress=json.dumps([
+            {"track_id": track["id"], "track_name": track["name"], "status": "pending"}
+            for track in tracks
+        ]),
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    print(f"📥 [INFO] Queued {tier} analysis job {job.id} for {kind} {target_id} ({len(tracks)} tracks)")
+    _executor.submit(_run_job, job.id)
+    return job
+
+
+def _update_job(job_id, **fields):
+    AnalysisJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+    db.session.commit()
+
+
+def _run_job(job_id):
+    with _app.app_context():
+        job = db.session.get(AnalysisJob, job_id)
+        if job is None or job.state not in ACTIVE_STATES:
+            return
+
+        # Після перезапуску кожен gunicorn-воркер відновлює незавершені задачі —
+        # виконує лише той, хто перший узяв лок задачі
+        with analysis_job_lock(job_id) as acquired:
+            if not acquired:
+                print(f"⏭️ [INFO] Job {job_id} is already running in another worker, skipping")
+                return
+
+            # Той самий альбом/плейлист зараз аналізує інша задача чи фоновий перерахунок:
+            # задача лишається в черзі й пробує знову, коли лок звільниться
+            with analysis_run_lock(job.kind, job.target_id, job.tier) as acquired:
+                if acquired:
+                    _execute_job(job_id)
+                    return
+
+        print(f"⏳ [INFO] {job.kind} {job.target_id} is being analyzed elsewhere, "
+              f"retrying job {job_id} in {ANALYSIS_JOB_RETRY_SEC:.0f}s")
+        _retry_later(job_id)
+
+
+def _retry_later(job_id):
+    timer = threading.Timer(ANALYSIS_JOB_RETRY_SEC, _executor.submit, (_run_job, job_id))
+    timer.daemon = True
+    timer.start()
+
+
+def _execute_job(job_id):
+    # Стан міг змінитися, поки інший воркер тримав лок
+    db.session.expire_all()
+    job = db.session.get(AnalysisJob, job_id)
+    if job is None or job.state not in ACTIVE_STATES:
+        return
+
+    kind, target_id, snapshot_id, tier = job.kind, job.target_id, job.snapshot_id, job.tier
+    tracks = json.loads(job.tracks)
+    progress = json.loads(job.progress) if job.progress else []
+    progress_by_id = {entry["track_id"]: entry for entry in progress}
+    progress_lock = threading.Lock()
+
+    _update_job(job_id, state="running")
+    print(f"⚙️ [INFO] Running analysis job {job_id} for {kind} {target_id}")
+
+    def on_track_done(track, feats, n_windows=None):
+        # Викликається з різних потоків екстракції; запис у БД теж під локом,
+        # щоб старіший знімок прогресу не перезаписав новіший
+        with progress_lock:
+            entry = progress_by_id.get(track["id"])
+            if entry is not None:
+                entry["status"] = "done" if feats is not None else "failed"
+                if feats is not None:
+                    # Фічі й теги доступні одразу, ще до кластеризації всього списку
+                    entry["features"] = feats
+                    entry["tags"] = classify_track_multi(feats[:9])
+                if n_windows is not None:
+                    # Скільки вікон треку реально проаналізовано (None — взято зі сховища)
+                    entry["windows"] = n_windows
+            done = sum(1 for e in progress if e["status"] != "pending")
+            _update_job(job_id, progress=json.dumps(progress), progress_done=done)
+
+    try:
+        result = run_analysis(
+            kind, target_id, tracks, on_track_done=on_track_done, snapshot_id=snapshot_id, tier=tier
+        )
+        _update_job(job_id, state="done", result=json.dumps(result))
+        print(f"✅ [INFO] Analysis job {job_id} finished")
+    except AnalysisError as e:
+        db.session.rollback()
+        _update_job(job_id, state="failed", error=str(e))
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] Analysis job {job_id} crashed: {e}")
+        _update_job(job_id, state="failed", error="Analysis failed")
@@ -0,0 +1,75 @@
+import os
+import time
+import hashlib
+from contextlib import contextmanager
+from sqlalchemy import text
+from models import db
+
+# Скільки запит чекає, поки інший запит того ж альбому/плейлиста знайде або створить задачу.
+# Після таймауту працює без лока (як раніше) — дублікат можливий, але запит не зависає.
+ANALYSIS_LOCK_TIMEOUT_SEC = float(os.getenv("ANALYSIS_LOCK_TIMEOUT_SEC", "30"))
+_POLL_SEC = 0.2
+
+
+def _lock_key(*parts):
+    # Ключ advisory-лока Postgres — знакове 64-бітне число
+    name = ":".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+@contextmanager
+def advisory_lock(*parts, wait=True, timeout=ANALYSIS_LOCK_TIMEOUT_SEC):
+    """
+    Advisory-лок Postgres на рівні сесії в окремому з'єднанні: діє між потоками і
+    gunicorn-воркерами й знімається сам, якщо процес упав. Повертає (yield), чи взято лок.
+    """
+    key = _lock_key(*parts)
+    conn = db.engine.connect()
+    acquired = False
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": key}).scalar()
+            conn.commit()  # лок сесії лишається, а з'єднання не висить "idle in transaction"
+            if acquired or not wait or time.monotonic() >= deadline:
+                break
+            time.sleep(_POLL_SEC)
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+            except Exception as e:
+                # З'єднання з невідомим станом лока не повертаємо в пул
+                print(f"❌ [ERROR] Cannot release analysis lock {':'.join(map(str, parts))}: {e}")
+                conn.invalidate()
+        conn.close()
+
+
+@contextmanager
+def analysis_submit_lock(kind, target_id, tier):
+    """
+    Single-flight для "знайти або створити задачу": другий запит чекає, поки перший
+    поставить задачу, і приєднується до неї замість повторного аналізу.
+    """
+    with advisory_lock("submit", kind, target_id, tier) as acquired:
+        if not acquired:
+            print(f"⚠️ [WARN] Timed out waiting for analysis lock of {kind} {target_id} ({tier})")
+        yield acquired
+
+
+def analysis_run_lock(kind, target_id, tier):
+    """
+    Неблокуючий лок на час обчислення аналізу: задачу чи фоновий перерахунок того ж
+    альбому/плейлиста в іншому воркері не запускаємо вдруге.
+    """
+    return advisory_lock("run", kind, target_id, tier, wait=False)
+
+
+def analysis_job_lock(job_id):
+    """
+    Неблокуючий лок конкретної задачі: поки воркер її виконує, інші воркери її не
+    запускають і не повертають у чергу після свого перезапуску.
+    """
+    return advisory_lock("job", job_id, wait=False)
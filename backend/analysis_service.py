@@ -0,0 +1,433 @@
+import json
+import gzip
+import hashlib
+import os
+import time
+import threading
+from collections import Counter
+import numpy as np
+from sqlalchemy import update, bindparam
+from models import db, AnalyzedAlbum, AnalyzedPlaylist, AlbumTrackFeature, PlaylistTrackFeature, TrackFeature
+from track_store import collect_tracks_features, stored_provenance
+from features_extractor import EXTRACTOR_VERSION, FEATURE_PARAMS, HIGH_LEVEL_BACKEND
+from bulk_upsert import upsert_rows
+from feature_vectors import pack_features, unpack_features, unpack_matrix, features_to_list
+from calculate_consistency_score import calculate_mean_feature_vector, calculate_consistency_score
+from cluster_tracks import analyze_tracks
+from analysis_tiers import DEFAULT_TIER, tiers_at_least
+
+# Альбоми й плейлисти аналізуються однаково, відрізняються лише таблиці
+ANALYSIS_TARGETS = {
+    "album": {
+        "id_field": "album_id",
+        "summary_model": AnalyzedAlbum,
+        "track_model": AlbumTrackFeature,
+    },
+    "playlist": {
+        "id_field": "playlist_id",
+        "summary_model": AnalyzedPlaylist,
+        "track_model": PlaylistTrackFeature,
+        # Плейлисти змінюються: зберігаємо snapshot_id і набір треків для інкрементального оновлення
+        "tracks_snapshot": True,
+    },
+}
+
+
+# Як часто записувати накопичені в пам'яті перегляди аналізів (секунди).
+# Якщо воркер зупиниться, пропадуть лише перегляди за останній інтервал.
+VIEW_FLUSH_SEC = float(os.getenv("VIEW_FLUSH_SEC", "60"))
+
+_views_lock = threading.Lock()
+_pending_views = Counter()  # (kind, target_id, tier) -> кількість переглядів, ще не записаних у БД
+_views_flushed_at = [time.monotonic()]
+
+
+class AnalysisError(Exception):
+    pass
+
+
+def _target(kind):
+    return ANALYSIS_TARGETS[kind]
+
+
+def get_cached_summary(kind, target_id, tier=DEFAULT_TIER):
+    """
+    Збережений аналіз рівня tier або кращого (кращий рівень підходить і для швидшого запиту).
+    Аналіз гіршого рівня ніколи не видається за кращий.
+    Підсумок без вектора фіч (наприклад, JSON не вдалося перенести у features_vec) вважається
+    відсутнім — альбом/плейлист аналізується знову.
+    """
+    target = _target(kind)
+    model = target["summary_model"]
+    allowed = tiers_at_least(tier)
+    summaries = model.query.filter(
+        getattr(model, target["id_field"]) == target_id,
+        model.tier.in_(allowed),
+        model.features_vec.isnot(None)
+    ).all()
+    return min(summaries, key=lambda summary: allowed.index(summary.tier), default=None)
+
+
+def load_track_matrix(kind, target_id, tier=DEFAULT_TIER):
+    """
+    Усі треки альбому/плейлиста рівня tier одним запитом: (рядки з track_id, track_name,
+    cluster, tags, матриця фіч (n_tracks, n_features)).
+    """
+    target = _target(kind)
+    track_model = target["track_model"]
+    rows = (
+        db.session.query(
+            track_model.track_id,
+            track_model.track_name,
+            track_model.cluster,
+            track_model.tags,
+            track_model.features_vec,
+        )
+        .filter(
+            getattr(track_model, target["id_field"]) == target_id,
+            track_model.tier == tier,
+            track_model.features_vec.isnot(None)
+        )
+        .all()
+    )
+    return rows, unpack_matrix([row.features_vec for row in rows])
+
+
+def build_cached_response(kind, target_id, tier=DEFAULT_TIER):
+    """
+    Відповідь для вже проаналізованого альбому/плейлиста або None, якщо аналізу ще немає.
+    """
+    target = _target(kind)
+    cached = get_cached_summary(kind, target_id, tier)
+    if not cached:
+        return None
+
+    print(f"🗂️ [INFO] Returning cached {cached.tier} analysis for {kind} {target_id}")
+
+    rows, matrix = load_track_matrix(kind, target_id, cached.tier)
+    print(f"🗂️ [INFO] Found {len(rows)} cached track features")
+
+    features_all = []
+    for row, features in zip(rows, matrix):
+        tags = []
+        try:
+            tags = json.loads(row.tags) if row.tags else []
+        except Exception as e:
+            print(f"❌ [ERROR] Failed to load tags JSON for track {row.track_id}: {e}")
+
+        features_all.append({
+            "track_id": row.track_id,
+            "track_name": row.track_name,
+            "features": features_to_list(features),
+            "cluster": row.cluster,
+            "tags": tags
+        })
+
+    print(f"🗂️ [INFO] Returning {len(features_all)} tracks with features")
+
+    return {
+        target["id_field"]: target_id,
+        "track_features": features_all,
+        "track_names": [row.track_name for row in rows],
+        "track_clusters": [row.cluster for row in rows],
+        "feature_vector": features_to_list(unpack_features(cached.features_vec), decimals=5),
+        "consistency_score": cached.consistency_score,
+        "tier": cached.tier,
+        "extractor_version": cached.extractor_version,
+        "cached": True
+    }
+
+
+def materialize_response(payload):
+    """
+    Стискає відповідь для кешованого шляху один раз: (gzip JSON, ETag).
+    """
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    return gzip.compress(body, compresslevel=6), hashlib.sha256(body).hexdigest()[:32]
+
+
+def get_cached_blob(kind, target_id, tier=DEFAULT_TIER, summary=None):
+    """
+    Готова стиснута відповідь і ETag для проаналізованого альбому/плейлиста або None.
+    Для аналізів, збережених до появи response_gz, відповідь збирається і зберігається один раз.
+    """
+    if summary is None:
+        summary = get_cached_summary(kind, target_id, tier)
+    if summary is None:
+        return None
+
+    if summary.response_gz is None:
+        payload = build_cached_response(kind, target_id, summary.tier)
+        summary.response_gz, summary.response_etag = materialize_response(payload)
+        db.session.commit()
+
+    return summary.response_gz, summary.response_etag
+
+
+def is_stale(summary):
+    """
+    Аналіз порахований старішою версією екстрактора або з іншими налаштуваннями фіч
+    (FEATURE_PARAMS): його можна віддавати, але фоновий перерахунок має його оновити.
+    """
+    return summary.extractor_version < EXTRACTOR_VERSION or summary.feature_params != FEATURE_PARAMS
+
+
+def record_view(kind, summary):
+    """
+    Лічильник переглядів аналізу — пріоритет для фонового перерахунку застарілих фіч.
+    Перегляди рахуються в пам'яті й записуються в БД пачкою не частіше ніж раз на
+    VIEW_FLUSH_SEC, щоб читання з кешу не робило UPDATE і commit на кожен запит.
+    """
+    key = (kind, getattr(summary, _target(kind)["id_field"]), summary.tier)
+    with _views_lock:
+        _pending_views[key] += 1
+        due = time.monotonic() - _views_flushed_at[0] >= VIEW_FLUSH_SEC
+    if due:
+        flush_views()
+
+
+def flush_views():
+    """
+    Записує накопичені перегляди одним executemany на тип аналізу.
+    Якщо запис не вдався, лічильники повертаються в чергу до наступної спроби.
+    """
+    with _views_lock:
+        pending = dict(_pending_views)
+        _pending_views.clear()
+        _views_flushed_at[0] = time.monotonic()
+    if not pending:
+        return
+
+    try:
+        for kind, target in ANALYSIS_TARGETS.items():
+            rows = [
+                {"b_id": target_id, "b_tier": tier, "b_views": views}
+                for (row_kind, target_id, tier), views in pending.items()
+                if row_kind == kind
+            ]
+            if not rows:
+                continue
+            table = target["summary_model"].__table__
+            db.session.execute(
+                update(table)
+                .where(table.c[target["id_field"]] == bindparam("b_id"), table.c.tier == bindparam("b_tier"))
+                .values(view_count=table.c.view_count + bindparam("b_views")),
+                rows
+            )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ [WARN] Cannot save {len(pending)} view counter(s), will retry: {e}")
+        with _views_lock:
+            for key, views in pending.items():
+                _pending_views[key] += views
+
+
+def load_cached_response(blob):
+    return json.loads(gzip.decompress(blob))
+
+
+def is_snapshot_current(summary, snapshot_id):
+    return summary is not None and snapshot_id is not None and summary.snapshot_id == snapshot_id
+
+
+def refresh_snapshot_if_unchanged(summary, tracks, snapshot_id):
+    """
+    Плейлист змінився, але запитаний набір треків той самий (наприклад, змінився
+    лише порядок) — достатньо оновити snapshot_id збереженого аналізу без перерахунку.
+    Повертає True, якщо збережений аналіз актуальний.
+    """
+    if summary is None or not summary.track_ids:
+        return False
+
+    if set(json.loads(summary.track_ids)) != {track["id"] for track in tracks}:
+        return False
+
+    summary.snapshot_id = snapshot_id
+    db.session.commit()
+    print(f"🔁 [INFO] Snapshot changed to {snapshot_id}, playlist tracks are the same")
+    return True
+
+
+def _load_previous_track_features(kind, target_id, tier=DEFAULT_TIER):
+    """
+    Вектори треків з попереднього аналізу цього альбому/плейлиста того ж рівня: {track_id: features}.
+    Аналіз, порахований іншим бекендом high-level фіч, не перевикористовується.
+    """
+    summary = db.session.get(_target(kind)["summary_model"], (target_id, tier))
+    if summary is None or summary.high_level_backend != HIGH_LEVEL_BACKEND:
+        return {}
+    rows, matrix = load_track_matrix(kind, target_id, tier)
+    return {row.track_id: features_to_list(features) for row, features in zip(rows, matrix)}
+
+
+def run_analysis(kind, target_id, tracks, on_track_done=None, snapshot_id=None, tier=DEFAULT_TIER,
+                 requested_ids=None, analyze_missing=True):
+    """
+    Повний аналіз альбому/плейлиста: фічі треків, кластери, теги, центроїд
+    і consistency score; результат зберігається в БД.
+    Повторний аналіз інкрементальний: вектори вже проаналізованих треків беруться з БД,
+    завантажуються лише нові треки, а видалені прибираються; кластери, центроїд
+    і consistency score перераховуються з векторів.
+    on_track_done(track, features) викликається для кожного треку, щойно він готовий
+    (features = None, якщо трек не вдалося проаналізувати).
+    Усі вектори й збережені рядки належать одному рівню якості tier — рівні не змішуються.
+    requested_ids — запитаний набір треків для порівняння snapshot (за замовчуванням id з tracks);
+    він зберігається окремо від проаналізованих треків, серед яких немає тих, що не вдалися.
+    analyze_missing=False — аналіз лише зі збережених векторів, без завантаження аудіо.
+    Повертає словник відповіді API.
+    """
+    target = _target(kind)
+    if requested_ids is None:
+        requested_ids = [track["id"] for track in tracks]
+    id_field = target["id_field"]
+    track_model = target["track_model"]
+
+    previous = _load_previous_track_features(kind, target_id, tier)
+    if previous:
+        print(f"🔁 [INFO] Re-analyzing {kind} {target_id}: {len(previous)} track(s) from previous analysis")
+
+    extracted = collect_tracks_features(
+        tracks, on_track_done=on_track_done, known=previous, tier=tier, analyze_missing=analyze_missing
+    )
+    tracks = [track for track, _ in extracted]
+    features_all = [feats for _, feats in extracted]
+
+    if not features_all:
+        print(f"🚫 [ERROR] No audio features extracted for {kind} {target_id}")
+        raise AnalysisError("No audio features extracted")
+
+    analysis_results = analyze_tracks(np.array(features_all))
+    extractor_version, feature_params = stored_provenance([track["id"] for track in tracks], tier)
+
+    mean_features = calculate_mean_feature_vector(features_all)
+    consistency_score = calculate_consistency_score(features_all)
+
+    # Треки, яких більше немає в альбомі/плейлисті (або без вектора поточного бекенду) —
+    # за рядками в БД, а не за previous, який порожній після зміни бекенду
+    removed = track_model.query.filter(
+        getattr(track_model, id_field) == target_id,
+        track_model.tier == tier,
+        track_model.track_id.notin_([track["id"] for track in tracks])
+    ).delete(synchronize_session=False)
+    if removed:
+        print(f"🗑️ [INFO] Dropped {removed} removed track(s) from {kind} {target_id}")
+
+    # Треки з кластером і тегами та підсумок альбому/плейлиста — по одному upsert на таблицю
+    upsert_rows(track_model, [
+        {
+            id_field: target_id,
+            "track_id": track["id"],
+            "tier": tier,
+            "track_name": track["name"],
+            "features_vec": pack_features(features_all[idx]),
+            "cluster": int(analysis_results[idx]["cluster"]),
+            "tags": json.dumps(analysis_results[idx]["tags"]),
+        }
+        for idx, track in enumerate(tracks)
+    ], [id_field, "track_id", "tier"])
+
+    response = {
+        id_field: target_id,
+        "track_features": [
+            {
+                "track_id": track["id"],
+                "track_name": track["name"],
+                "features": features_all[idx],
+                "cluster": int(analysis_results[idx]["cluster"]),
+                "tags": analysis_results[idx]["tags"]
+            }
+            for idx, track in enumerate(tracks)
+        ],
+        "feature_vector": mean_features,
+        "consistency_score": consistency_score,
+        "track_names": [track["name"] for track in tracks],
+        "track_clusters": [int(result["cluster"]) for result in analysis_results],
+        "tier": tier,
+        "extractor_version": extractor_version,
+        "cached": False
+    }
+
+    # Відповідь для кешованого шляху зберігається разом з аналізом
+    response_gz, response_etag = materialize_response({**response, "cached": True})
+
+    summary_row = {
+        id_field: target_id,
+        "tier": tier,
+        "features_vec": pack_features(mean_features),
+        "consistency_score": consistency_score,
+        "response_gz": response_gz,
+        "response_etag": response_etag,
+        "extractor_version": extractor_version,
+        "feature_params": feature_params,
+        "high_level_backend": HIGH_LEVEL_BACKEND,
+    }
+    if target.get("tracks_snapshot"):
+        summary_row["snapshot_id"] = snapshot_id
+        summary_row["track_ids"] = json.dumps(requested_ids)
+    upsert_rows(target["summary_model"], [summary_row], [id_field, "tier"])
+
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    print(f"💾 [INFO] Saved {tier} {kind} analysis and all track features to DB for {kind} {target_id}")
+
+    return response
+
+
+def sync_track_vectors_from_store(kind, track_ids=None, tier=DEFAULT_TIER):
+    """
+    Копіює вектори треків зі спільного сховища в рядки альбомів/плейлистів одним UPDATE ... FROM
+    (після reaggregate_track_features). Повертає id альбомів/плейлистів, яких це стосується.
+    """
+    target = _target(kind)
+    track_model = target["track_model"]
+    id_column = getattr(track_model, target["id_field"])
+
+    conditions = [
+        track_model.track_id == TrackFeature.track_id,
+        track_model.tier == TrackFeature.tier,
+        track_model.tier == tier,
+        TrackFeature.high_level_backend == HIGH_LEVEL_BACKEND,
+        TrackFeature.features_vec.isnot(None),
+    ]
+    if track_ids is not None:
+        conditions.append(TrackFeature.track_id.in_(track_ids))
+
+    db.session.execute(
+        update(track_model).where(*conditions).values(features_vec=TrackFeature.features_vec),
+        execution_options={"synchronize_session": False}
+    )
+    db.session.commit()
+
+    query = db.session.query(id_column).filter(track_model.tier == tier).distinct()
+    if track_ids is not None:
+        query = query.filter(track_model.track_id.in_(track_ids))
+    return [target_id for (target_id,) in query.all()]
+
+
+def reanalyze_from_store(kind, target_id, tier=DEFAULT_TIER):
+    """
+    Перераховує кластери, центроїд, consistency score і готову відповідь альбому/плейлиста
+    зі збережених векторів треків, без завантаження аудіо.
+    """
+    target = _target(kind)
+    summary = db.session.get(target["summary_model"], (target_id, tier))
+    if summary is None:
+        return None
+
+    rows, _ = load_track_matrix(kind, target_id, tier)
+    # Виконавці потрібні лише для пошуку аудіо, а тут усі вектори вже відомі
+    tracks = [{"id": row.track_id, "name": row.track_name, "artists": []} for row in rows]
+    requested_ids = None
+    if target.get("tracks_snapshot") and summary.track_ids:
+        requested_ids = json.loads(summary.track_ids)
+        order = {track_id: idx for idx, track_id in enumerate(requested_ids)}
+        tracks.sort(key=lambda track: order.get(track["id"], len(order)))
+
+    return run_analysis(
+        kind, target_id, tracks, snapshot_id=getattr(summary, "snapshot_id", None), tier=tier,
+        requested_ids=requested_ids, analyze_missing=False
+    )
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import threading
+from flask import Response, jsonify, stream_with_context
+from models import db, AnalysisJob
+from analysis_jobs import job_to_dict
+
+STREAM_POLL_INTERVAL = 0.5
+STREAM_KEEPALIVE_SEC = 15
+
+# Кожен відкритий потік займає потік gunicorn (gthread) на весь час аналізу.
+# Одночасних потоків задач не більше ANALYSIS_STREAM_MAX на процес, решта клієнтів
+# отримують 503 і опитують /analysis_jobs/<id>; потік, довший за STREAM_MAX_DURATION_SEC,
+# закривається, і клієнт так само переходить на опитування.
+ANALYSIS_STREAM_MAX = int(os.getenv("ANALYSIS_STREAM_MAX", "4"))
+STREAM_MAX_DURATION_SEC = int(os.getenv("STREAM_MAX_DURATION_SEC", "120"))
+STREAM_RETRY_AFTER_SEC = 3
+
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _track_event(entry):
+    return _event("track", {
+        "track_id": entry["track_id"],
+        "track_name": entry["track_name"],
+        "status": entry["status"],
+        "features": entry.get("features"),
+        "tags": entry.get("tags", []),
+        "windows": entry.get("windows"),
+    })
+
+
+def _cached_events(cached):
+    track_features = cached["track_features"]
+    yield _event("job", {"job_id": None, "state": "done", "total": len(track_features)})
+    for tf in track_features:
+        yield _track_event({**tf, "status": "done"})
+    yield _event("summary", cached)
+
+
+def _job_events(job_id):
+    """
+    Стежить за фоновою задачею через БД (вона може виконуватись в іншому воркері)
+    і віддає кожен трек, щойно його фічі готові.
+    """
+    sent = set()
+    announced = False
+    last_sent = time.monotonic()
+    deadline = time.monotonic() + STREAM_MAX_DURATION_SEC
+
+    while time.monotonic() < deadline:
+        job = db.session.get(AnalysisJob, job_id, populate_existing=True)
+        job_data = job_to_dict(job) if job else None
+        # Не тримаємо транзакцію відкритою між опитуваннями
+        db.session.rollback()
+
+        if job_data is None:
+            yield _event("error", {"error": "Job not found"})
+            return
+
+        if not announced:
+            yield _event("job", {
+                "job_id": job_id,
+                "state": job_data["state"],
+                "total": job_data["progress"]["total"],
+            })
+            announced = True
+            last_sent = time.monotonic()
+
+        for entry in job_data["progress"]["tracks"]:
+            if entry["status"] != "pending" and entry["track_id"] not in sent:
+                sent.add(entry["track_id"])
+                yield _track_event(entry)
+                last_sent = time.monotonic()
+
+        if job_data["state"] == "done":
+            yield _event("summary", job_data["result"])
+            return
+        if job_data["state"] == "failed":
+            yield _event("error", {"error": job_data["error"] or "Analysis failed"})
+            return
+
+        if time.monotonic() - last_sent > STREAM_KEEPALIVE_SEC:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+
+        time.sleep(STREAM_POLL_INTERVAL)
+
+    # Потік закінчився без summary: EventSource повідомить про помилку з'єднання,
+    # і клієнт дочекається результату опитуванням, звільнивши потік сервера
+    print(f"⏱️ [INFO] Closing analysis stream of job {job_id} after {STREAM_MAX_DURATION_SEC}s")
+
+
+def analysis_event_stream(cached=None, job_id=None):
+    """
+    Server-sent events для аналізу альбому/плейлиста:
+    job (загальна кількість треків), track (фічі й теги кожного треку, щойно він готовий),
+    summary (кластери, середній вектор і consistency score) або error.
+    """
+    if cached:
+        # Кешований аналіз віддається одразу — потік сервера не утримується
+        return _event_response(_cached_events(cached))
+
+    if not _acquire_stream_slot():
+        print(f"🚦 [WARN] Too many analysis streams, job {job_id} falls back to polling")
+        response = jsonify({"error": "Too many analysis streams", "job_id": job_id})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(STREAM_RETRY_AFTER_SEC)
+        return response
+
+    response = _event_response(_job_events(job_id))
+    # Сервер закриває відповідь і тоді, коли клієнт відключився посеред потоку
+    response.call_on_close(_release_stream_slot)
+    return response
+
+
+def _acquire_stream_slot():
+    global _open_streams
+    with _streams_lock:
+        if _open_streams >= ANALYSIS_STREAM_MAX:
+            return False
+        _open_streams += 1
+        return True
+
+
+def _release_stream_slot():
+    global _open_streams
+    with _streams_lock:
+        _open_streams -= 1
+
+
+def _event_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # проксі не повинен буферизувати потік
+        },
+    )
+
+
+def analysis_stream_stats():
+    with _streams_lock:
+        return {"open": _open_streams, "max": ANALYSIS_STREAM_MAX}
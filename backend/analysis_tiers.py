@@ -0,0 +1,29 @@
+# Рівні якості аналізу. Розкладка вектора (9 high-level + 13 MFCC + 12 chroma + 7 contrast)
+# однакова для всіх рівнів, відрізняються лише вікна і частота дискретизації.
+ANALYSIS_TIERS = {
+    # Швидкий перегляд великих плейлистів: одне коротке вікно в центрі, нижча частота
+    "fast": {"n_windows": 1, "chunk_length_ms": 15000, "sample_rate": 16000},
+    # Поточна поведінка: три вікна по 30 с навколо центру
+    "standard": {"n_windows": 3, "chunk_length_ms": 30000, "sample_rate": 22050},
+    # Більше вікон — точніше середнє для треку
+    "full": {"n_windows": 5, "chunk_length_ms": 30000, "sample_rate": 22050},
+}
+DEFAULT_TIER = "standard"
+
+# Від гіршого до кращого: кешований аналіз кращого рівня підходить і для гіршого запиту
+TIER_ORDER = ["fast", "standard", "full"]
+
+
+def is_valid_tier(tier):
+    return tier in ANALYSIS_TIERS
+
+
+def get_tier(tier):
+    return ANALYSIS_TIERS[tier]
+
+
+def tiers_at_least(tier):
+    """
+    Рівні, результати яких можна віддати на запит рівня tier, починаючи з найкращого.
+    """
+    return list(reversed(TIER_ORDER[TIER_ORDER.index(tier):]))
@@ -2,25 +2,42 @@ import os
 import re
 import requests
 import json
+import gzip
 import time
 import numpy as np
 import logging
 from collections import defaultdict
 from datetime import datetime, timezone, timedelta
 from bs4 import BeautifulSoup
-from flask import Flask, request, redirect, session, jsonify
+from flask import Flask, Response, request, redirect, session, jsonify
 # from flask_cors import CORS, cross_origin
 from flask_session import Session
 from dotenv import load_dotenv
 from routes.groq_client import get_song_themes_from_groq
-from models import db, User, UserLyricsTopic, AnalyzedAlbum, AnalyzedPlaylist, AlbumTrackFeature, PlaylistTrackFeature, Rating
+from models import db, User, UserLyricsTopic, AnalysisJob, Rating
+from db_app import database_url
 from utils import hash_lyrics, is_request_allowed
 from cache_lyrics import get_cached_lyrics, set_cached_lyrics, get_cached_lyrics_by_track_id, set_cached_lyrics_by_track_id
-from yt_download_audio import download_audio
-from sqlalchemy.exc import IntegrityError
-from features_extractor import extract_features_from_full_track
-from calculate_consistency_score import calculate_mean_feature_vector, calculate_consistency_score
-from cluster_tracks import analyze_tracks
+from extraction_pool import start_extraction_pool, window_stats
+from pipeline import pipeline_stats
+from features_extractor import reccobeats_limiter
+from reccobeats_cache import cache_stats
+from audio_cache import audio_cache_stats, evict_cached_audio
+from analysis_service import (
+    get_cached_blob,
+    load_cached_response,
+    get_cached_summary,
+    is_snapshot_current,
+    refresh_snapshot_if_unchanged,
+    is_stale,
+    record_view,
+)
+from analysis_tiers import DEFAULT_TIER, ANALYSIS_TIERS, is_valid_tier
+from analysis_jobs import init_analysis_jobs, find_active_job, submit_analysis_job, job_to_dict
+from analysis_locks import analysis_submit_lock
+from feature_refresh import init_feature_refresh, request_refresh, feature_refresh_stats, mark_track_stale
+from youtube_resolution_cache import resolution_stats, pin_resolved_video, invalidate_resolution
+from analysis_stream import analysis_event_stream, analysis_stream_stats
 
 # PROFILE_PATH = "./flask_session_files/profile_data.json" <--- для локальної розробки
 
@@ -36,15 +53,15 @@ REDIRECT_URI = os.getenv("REDIRECT_URI")
 # DB_PASS=os.getenv("DB_PASS")
 
 LASTFM_API_KEY=os.getenv("LASTFM_API_KEY")
+# Email-и користувачів, яким дозволено змінювати спільні дані (наприклад, збіги YouTube), через кому
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
 
 app = Flask(__name__, static_folder="frontend_build", template_folder="frontend_build")
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'change-me-in-prod')
 
 # app.config['SQLALCHEMY_DATABASE_URI'] = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}" <--- для локальної розробки
 
-DATABASE_URL = os.getenv("DATABASE_URL") # для деплою
-if DATABASE_URL and DATABASE_URL.startswith("postgres://"): # для деплою
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1) # для деплою
+DATABASE_URL = database_url() # для деплою
 
 app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -67,6 +84,18 @@ app.config['SESSION_COOKIE_SECURE'] = True
 
 Session(app)
 
+# Схему БД оновлює окрема команда migrate_schema.py перед стартом сервера,
+# а фонові сервіси запускає gunicorn-хук post_worker_init (gunicorn.conf.py) —
+# імпорт app (скрипти, тести) нічого не змінює в БД і не запускає потоків чи процесів.
+def start_background_services():
+    """
+    Фонові задачі аналізу альбомів/плейлистів, фоновий перерахунок застарілих фіч
+    і прогрітий пул процесів екстракції — по одному на воркер gunicorn.
+    """
+    init_analysis_jobs(app)
+    init_feature_refresh(app)
+    start_extraction_pool()
+
 # CORS config
 # CORS(app, supports_credentials=True, origins=["https://mymusicmind.netlify.app"])
 
@@ -806,59 +835,83 @@ def get_lyrics_topics_by_track_id(track_id):
 ############## Analyze lyrics END #####################
 
 ############## Album Analyze ##########################
-@app.route("/analyze_album/<album_id>")
-def analyze_album(album_id):
-    access_token = session.get("access_token")
-    if not access_token:
-        print(f"⚠️ [WARN] Unauthorized access attempt for album {album_id}")
-        return jsonify({"error": "Unauthorized"}), 401
-
-    # Перевірка кешу аналізу альбому
-    cached = AnalyzedAlbum.query.filter_by(album_id=album_id).first()
-    if cached:
-        print(f"🗂️ [INFO] Returning cached analysis for album {album_id}")
-
-        track_features_db = AlbumTrackFeature.query.filter_by(album_id=album_id).all()
-        print(f"🗂️ [INFO] Found {len(track_features_db)} cached track features")
-
-        track_names = [tf.track_name for tf in track_features_db]
-        track_clusters = [tf.cluster for tf in track_features_db]
-
-        features_all = []
-        for tf in track_features_db:
-            try:
-                features_json = json.loads(tf.features)
-            except Exception as e:
-                print(f"❌ [ERROR] Failed to load features JSON for track {tf.track_id}: {e}")
-                features_json = None
-
-            tags = []
-            try:
-                tags = json.loads(tf.tags) if tf.tags else []
-            except Exception as e:
-                print(f"❌ [ERROR] Failed to load tags JSON for track {tf.track_id}: {e}")
+def _cached_analysis_response(response_gz, etag):
+    """
+    Готовий аналіз з БД: 304 на умовний запит з тим самим ETag, інакше збережений gzip
+    як є (або розпакований, якщо клієнт не приймає gzip).
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif request.accept_encodings["gzip"]:
+        response = Response(response_gz, mimetype="application/json")
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        response = Response(gzip.decompress(response_gz), mimetype="application/json")
 
-            features_all.append({
-                "track_id": tf.track_id,
-                "track_name": tf.track_name,
-                "features": features_json,
-                "cluster": tf.cluster,
-                "tags": tags
-            })
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
 
-        print(f"🗂️ [INFO] Returning {len(features_all)} tracks with features")
+def _requested_tier():
+    """
+    Рівень якості аналізу з ?tier=fast|standard|full (за замовчуванням standard) або None, якщо він невідомий.
+    """
+    tier = request.args.get("tier", DEFAULT_TIER)
+    return tier if is_valid_tier(tier) else None
 
-        return jsonify({
-            "album_id": album_id,
-            "track_features": features_all,
-            "track_names": track_names,
-            "track_clusters": track_clusters,
-            "feature_vector": json.loads(cached.features),
-            "consistency_score": cached.consistency_score,
-            "cached": True
-        })
+def _invalid_tier_response():
+    return jsonify({"error": f"Unknown tier, expected one of: {', '.join(ANALYSIS_TIERS)}"}), 400
 
-    # Якщо немає кешу — запитуємо треки з Spotify API
+def _serve_cached_analysis(kind, target_id, summary):
+    """
+    Збережений аналіз (cached-кортеж для відповіді). Аналіз старішої версії екстрактора
+    теж віддається, але стає першим у черзі фонового перерахунку.
+    """
+    cached = get_cached_blob(kind, target_id, summary.tier, summary)
+    if is_stale(summary):
+        print(f"🕰️ [INFO] Serving stale {kind} {target_id} "
+              f"(extractor v{summary.extractor_version}, params {summary.feature_params})")
+        request_refresh(kind, target_id, summary.tier)
+    record_view(kind, summary)
+    return cached
+
+def _resolve_album_analysis(album_id, access_token, tier=DEFAULT_TIER):
+    """
+    Повертає (cached, job, error): готовий аналіз з кешу, фонову задачу
+    (наявну або щойно створену) або відповідь з помилкою.
+    """
+    # Перевірка кешу аналізу альбому (аналіз кращого рівня теж підходить)
+    summary = get_cached_summary("album", album_id, tier)
+    if summary:
+        return _serve_cached_analysis("album", album_id, summary), None, None
+
+    # Одночасні запити того ж альбому (з різних потоків і воркерів) по черзі:
+    # перший ставить задачу, решта приєднуються до неї
+    with analysis_submit_lock("album", album_id, tier):
+        # Поки чекали на лок, інший запит міг завершити аналіз
+        summary = get_cached_summary("album", album_id, tier)
+        if summary:
+            return _serve_cached_analysis("album", album_id, summary), None, None
+
+        # Аналіз уже йде у фоні — повертаємо ту саму задачу
+        active_job = find_active_job("album", album_id, tier)
+        if active_job:
+            print(f"⏳ [INFO] Album {album_id} is already being analyzed (job {active_job.id})")
+            return None, active_job, None
+
+        # Якщо немає кешу — запитуємо треки з Spotify API
+        tracks, error = _fetch_album_tracks(album_id, access_token)
+        if error:
+            return None, None, error
+
+        # Завантаження і екстракція фіч виконуються фоновою задачею
+        return None, submit_analysis_job("album", album_id, tracks, tier=tier), None
+
+def _fetch_album_tracks(album_id, access_token):
+    """
+    Унікальні треки альбому зі Spotify API: (tracks, None) або (None, відповідь з помилкою).
+    """
     headers = {"Authorization": f"Bearer {access_token}"}
     url = f"https://api.spotify.com/v1/albums/{album_id}/tracks"
     tracks = []
@@ -868,7 +921,7 @@ def analyze_album(album_id):
         res = requests.get(url, headers=headers)
         if res.status_code != 200:
             print(f"❌ [ERROR] Failed to get album tracks for {album_id}, status: {res.status_code}")
-            return jsonify({"error": "Failed to get album tracks"}), 400
+            return None, (jsonify({"error": "Failed to get album tracks"}), 400)
         data = res.json()
         tracks += data["items"]
         url = data.get("next")
@@ -887,159 +940,96 @@ def analyze_album(album_id):
             unique_tracks[track_id] = track
     tracks = list(unique_tracks.values())
     print(f"✅ [INFO] Unique tracks count after deduplication: {len(tracks)}")
+    return tracks, None
 
-    os.makedirs("audio_temp", exist_ok=True)
-    features_all = []
-    track_names = []
-
-    # Обробка аудіо, екстракція фіч
-    for idx, track in enumerate(tracks):
-        name = track["name"]
-        artist = track["artists"][0]["name"]
-        print(f"🎧 [INFO] Processing track {idx + 1}: '{name}' by {artist}")
-
-        path = download_audio(name, artist)
-        if not path:
-            print(f"⚠️ [WARN] Failed to download audio for track '{name}'")
-            continue
-
-        print(f"🔍 [DEBUG] Extracting features for '{name}' from {path}")
-        feats = extract_features_from_full_track(path)
-
-        if feats is not None:
-            features_all.append(feats.tolist())
-            track_names.append(name)
-            print(f"🎯 [INFO] Extracted features for track '{name}'")
-        else:
-            print(f"⚠️ [WARN] Skipping track '{name}' due to failed extraction")
-
-        try:
-            os.remove(path)
-            print(f"🗑️ [INFO] Deleted temporary audio file for track '{name}'")
-        except Exception as e:
-            print(f"❌ [ERROR] Cannot remove {path}: {e}")
-
-        time.sleep(2.5)
-
-    if not features_all:
-        print(f"🚫 [ERROR] No audio features extracted for album {album_id}")
-        return jsonify({"error": "No audio features extracted"}), 400
+@app.route("/analyze_album/<album_id>")
+def analyze_album(album_id):
+    access_token = session.get("access_token")
+    if not access_token:
+        print(f"⚠️ [WARN] Unauthorized access attempt for album {album_id}")
+        return jsonify({"error": "Unauthorized"}), 401
 
-    analysis_results = analyze_tracks(np.array(features_all))
+    tier = _requested_tier()
+    if tier is None:
+        return _invalid_tier_response()
 
-    mean_features = calculate_mean_feature_vector(features_all)
-    consistency_score = calculate_consistency_score(features_all)
+    cached, job, error = _resolve_album_analysis(album_id, access_token, tier)
+    if error:
+        return error
+    if cached:
+        return _cached_analysis_response(*cached)
+    return jsonify(job_to_dict(job)), 202
 
-    # Збереження треків з кластером і тегами
-    for idx, track in enumerate(tracks):
-        if idx >= len(features_all):
-            break
+@app.route("/analyze_album/<album_id>/stream")
+def analyze_album_stream(album_id):
+    access_token = session.get("access_token")
+    if not access_token:
+        print(f"⚠️ [WARN] Unauthorized access attempt for album {album_id}")
+        return jsonify({"error": "Unauthorized"}), 401
 
-        analyzed_track = AlbumTrackFeature(
-            album_id=album_id,
-            track_id=track["id"],
-            track_name=track["name"],
-            features=json.dumps(features_all[idx]),
-            cluster=int(analysis_results[idx]["cluster"]),
-            tags=json.dumps(analysis_results[idx]["tags"])
-        )
-        db.session.merge(analyzed_track)
+    tier = _requested_tier()
+    if tier is None:
+        return _invalid_tier_response()
 
-    # Збереження аналізу альбому
-    new_entry = AnalyzedAlbum(
-        album_id=album_id,
-        features=json.dumps(mean_features),
-        consistency_score=consistency_score
+    cached, job, error = _resolve_album_analysis(album_id, access_token, tier)
+    if error:
+        return error
+    return analysis_event_stream(
+        cached=load_cached_response(cached[0]) if cached else None,
+        job_id=job.id if job else None
     )
-    db.session.merge(new_entry)
-
-    try:
-        db.session.commit()
-        print(f"💾 [INFO] Saved album analysis and all track features to DB for album {album_id}")
-    except IntegrityError:
-        db.session.rollback()
-        print(f"⚠️ [WARN] Album {album_id} already saved in parallel operation")
-        cached = AnalyzedAlbum.query.filter_by(album_id=album_id).first()
-        return jsonify({
-            "album_id": album_id,
-            "feature_vector": json.loads(cached.features),
-            "consistency_score": cached.consistency_score,
-            "cached": True
-        })
-
-    return jsonify({
-        "album_id": album_id,
-        "track_features": [
-            {
-                "track_id": track["id"],
-                "track_name": track["name"],
-                "features": features_all[idx],
-                "cluster": int(analysis_results[idx]["cluster"]),
-                "tags": analysis_results[idx]["tags"]
-            }
-            for idx, track in enumerate(tracks) if idx < len(features_all)
-        ],
-        "feature_vector": mean_features,
-        "consistency_score": consistency_score,
-        "track_names": [track["name"] for track in tracks],
-        "track_clusters": [int(result["cluster"]) for result in analysis_results],
-        "cached": False
-    })
 ############## Album Analyze END ######################
 
 ############## Playlist Analyze ##########################
-@app.route("/analyze_playlist/<playlist_id>")
-def analyze_playlist(playlist_id):
-    access_token = session.get("access_token")
-    if not access_token:
-        print(f"⚠️ [WARN] Unauthorized access attempt for playlist {playlist_id}")
-        return jsonify({"error": "Unauthorized"}), 401
+def _resolve_playlist_analysis(playlist_id, access_token, tier=DEFAULT_TIER):
+    """
+    Повертає (cached, job, error) так само, як _resolve_album_analysis.
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
 
-    cached = AnalyzedPlaylist.query.filter_by(playlist_id=playlist_id).first()
-    if cached:
-        print(f"🗂️ [INFO] Returning cached analysis for playlist {playlist_id}")
+    # Дешевий запит лише за snapshot_id: якщо плейлист не змінився, збережений аналіз актуальний
+    snapshot_id = None
+    snapshot_res = requests.get(
+        f"https://api.spotify.com/v1/playlists/{playlist_id}",
+        headers=headers,
+        params={"fields": "snapshot_id"}
+    )
+    if snapshot_res.status_code == 200:
+        snapshot_id = snapshot_res.json().get("snapshot_id")
+    else:
+        print(f"⚠️ [WARN] Failed to get snapshot_id for playlist {playlist_id}, status: {snapshot_res.status_code}")
 
-        track_features_db = PlaylistTrackFeature.query.filter_by(playlist_id=playlist_id).all()
-        print(f"🗂️ [INFO] Found {len(track_features_db)} cached track features")
+    summary = get_cached_summary("playlist", playlist_id, tier)
+    if summary and (snapshot_id is None or is_snapshot_current(summary, snapshot_id)):
+        return _serve_cached_analysis("playlist", playlist_id, summary), None, None
 
-        track_names = [tf.track_name for tf in track_features_db]
-        track_clusters = [tf.cluster for tf in track_features_db]
+    with analysis_submit_lock("playlist", playlist_id, tier):
+        # Поки чекали на лок, інший запит міг оновити аналіз
+        summary = get_cached_summary("playlist", playlist_id, tier)
+        if summary and (snapshot_id is None or is_snapshot_current(summary, snapshot_id)):
+            return _serve_cached_analysis("playlist", playlist_id, summary), None, None
 
-        features_all = []
-        for tf in track_features_db:
-            try:
-                features_json = json.loads(tf.features)
-            except Exception as e:
-                print(f"❌ [ERROR] Failed to load features JSON for track {tf.track_id}: {e}")
-                features_json = None
+        active_job = find_active_job("playlist", playlist_id, tier)
+        if active_job:
+            print(f"⏳ [INFO] Playlist {playlist_id} is already being analyzed (job {active_job.id})")
+            return None, active_job, None
 
-            tags = []
-            try:
-                tags = json.loads(tf.tags) if tf.tags else []
-            except Exception as e:
-                print(f"❌ [ERROR] Failed to load tags JSON for track {tf.track_id}: {e}")
+        if summary:
+            print(f"🔁 [INFO] Playlist {playlist_id} changed since last analysis, refreshing")
 
-            features_all.append({
-                "track_id": tf.track_id,
-                "track_name": tf.track_name,
-                "features": features_json,
-                "cluster": tf.cluster,
-                "tags": tags
-            })
+        valid_tracks, error = _fetch_playlist_tracks(playlist_id, headers)
+        if error:
+            return None, None, error
 
-        print(f"🗂️ [INFO] Returning {len(features_all)} tracks with features")
+        if summary and refresh_snapshot_if_unchanged(summary, valid_tracks, snapshot_id):
+            return _serve_cached_analysis("playlist", playlist_id, summary), None, None
 
-        return jsonify({
-            "playlist_id": playlist_id,
-            "track_features": features_all,
-            "track_names": track_names,
-            "track_clusters": track_clusters,
-            "feature_vector": json.loads(cached.features),
-            "consistency_score": cached.consistency_score,
-            "cached": True
-        })
+        return None, submit_analysis_job("playlist", playlist_id, valid_tracks, snapshot_id=snapshot_id, tier=tier), None
 
-    headers = {"Authorization": f"Bearer {access_token}"}
+def _fetch_playlist_tracks(playlist_id, headers):
+    """
+    До 50 найпопулярніших треків плейлиста: (tracks, None) або (None, відповідь з помилкою).
+    """
     url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
     tracks = []
 
@@ -1048,7 +1038,7 @@ def analyze_playlist(playlist_id):
         res = requests.get(url, headers=headers)
         if res.status_code != 200:
             print(f"❌ [ERROR] Failed to get playlist tracks for {playlist_id}, status: {res.status_code}")
-            return jsonify({"error": "Failed to get playlist tracks"}), 400
+            return None, (jsonify({"error": "Failed to get playlist tracks"}), 400)
         data = res.json()
         tracks += data["items"]
         url = data.get("next")
@@ -1065,108 +1055,131 @@ def analyze_playlist(playlist_id):
 
     valid_tracks = sorted(valid_tracks, key=lambda t: t.get("popularity", 0), reverse=True)[:50]
     print(f"✅ [INFO] Selected top {len(valid_tracks)} tracks by popularity")
+    return valid_tracks, None
 
-    os.makedirs("audio_temp", exist_ok=True)
-    features_all = []
-    track_names = []
+@app.route("/analyze_playlist/<playlist_id>")
+def analyze_playlist(playlist_id):
+    access_token = session.get("access_token")
+    if not access_token:
+        print(f"⚠️ [WARN] Unauthorized access attempt for playlist {playlist_id}")
+        return jsonify({"error": "Unauthorized"}), 401
 
-    for idx, track in enumerate(valid_tracks):
-        name = track["name"]
-        artist = track["artists"][0]["name"]
-        print(f"🎧 [INFO] Processing track {idx + 1}: '{name}' by {artist}")
+    tier = _requested_tier()
+    if tier is None:
+        return _invalid_tier_response()
 
-        path = download_audio(name, artist)
-        if not path:
-            print(f"⚠️ [WARN] Failed to download audio for track '{name}'")
-            continue
+    cached, job, error = _resolve_playlist_analysis(playlist_id, access_token, tier)
+    if error:
+        return error
+    if cached:
+        return _cached_analysis_response(*cached)
+    return jsonify(job_to_dict(job)), 202
 
-        print(f"🔍 [DEBUG] Extracting features for '{name}' from {path}")
-        feats = extract_features_from_full_track(path)
+@app.route("/analyze_playlist/<playlist_id>/stream")
+def analyze_playlist_stream(playlist_id):
+    access_token = session.get("access_token")
+    if not access_token:
+        print(f"⚠️ [WARN] Unauthorized access attempt for playlist {playlist_id}")
+        return jsonify({"error": "Unauthorized"}), 401
 
-        if feats is not None:
-            features_all.append(feats.tolist())
-            track_names.append(name)
-            print(f"🎯 [INFO] Extracted features for track '{name}'")
-        else:
-            print(f"⚠️ [WARN] Skipping track '{name}' due to failed extraction")
+    tier = _requested_tier()
+    if tier is None:
+        return _invalid_tier_response()
 
-        try:
-            os.remove(path)
-            print(f"🗑️ [INFO] Deleted temporary audio file for track '{name}'")
-        except Exception as e:
-            print(f"❌ [ERROR] Cannot remove {path}: {e}")
+    cached, job, error = _resolve_playlist_analysis(playlist_id, access_token, tier)
+    if error:
+        return error
+    return analysis_event_stream(
+        cached=load_cached_response(cached[0]) if cached else None,
+        job_id=job.id if job else None
+    )
 
-        time.sleep(2.5)
+@app.route("/analysis_jobs/<job_id>")
+def get_analysis_job(job_id):
+    if not session.get("access_token"):
+        return jsonify({"error": "Unauthorized"}), 401
 
-    if not features_all:
-        print(f"🚫 [ERROR] No audio features extracted for playlist {playlist_id}")
-        return jsonify({"error": "No audio features extracted"}), 400
+    job = db.session.get(AnalysisJob, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
 
-    print(f"📊 [INFO] Feature vectors for each track in playlist {playlist_id}:")
-    for i, vec in enumerate(features_all, start=1):
-        print(f"Track {i} features: {vec}")
+    return jsonify(job_to_dict(job))
+############## Playlist Analyze END ######################
 
-    analysis_results = analyze_tracks(np.array(features_all))
+############## YouTube Resolution ######################
+YOUTUBE_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
 
-    mean_features = calculate_mean_feature_vector(features_all)
-    consistency_score = calculate_consistency_score(features_all)
+def _admin_error():
+    """
+    Доступ лише для адміністраторів (ADMIN_EMAILS): зміна спільних для всіх користувачів даних
+    (збіги YouTube) і внутрішня статистика сервісів. Повертає відповідь з помилкою або None.
+    """
+    if not session.get("access_token"):
+        return jsonify({"error": "Unauthorized"}), 401
 
-    # Збереження треків з кластером і тегами
-    for idx, track in enumerate(valid_tracks):
-        if idx >= len(features_all):
-            break
+    user_id = session.get("user_id")
+    user = db.session.get(User, user_id) if user_id else None
+    if user is None or not user.email or user.email.lower() not in ADMIN_EMAILS:
+        print(f"⛔ [WARN] User {user_id} is not allowed to access {request.path}")
+        return jsonify({"error": "Forbidden"}), 403
+    return None
 
-        analyzed_track = PlaylistTrackFeature(
-            playlist_id=playlist_id,
-            track_id=track["id"],
-            track_name=track["name"],
-            features=json.dumps(features_all[idx]),
-            cluster=int(analysis_results[idx]["cluster"]),
-            tags=json.dumps(analysis_results[idx]["tags"])
-        )
-        db.session.merge(analyzed_track)
+def _forget_track_audio(track_id):
+    # Аудіо і фічі треку взяті з невірного відео: прибираємо аудіо з кешу,
+    # а фоновий перерахунок заново проаналізує трек і аналізи, куди він входить
+    evict_cached_audio(track_id)
+    return mark_track_stale(track_id)
 
-    # Збереження аналізу плейлисту
-    new_entry = AnalyzedPlaylist(
-        playlist_id=playlist_id,
-        features=json.dumps(mean_features),
-        consistency_score=consistency_score
-    )
-    db.session.merge(new_entry)
+@app.route("/youtube_resolution/<track_id>", methods=["DELETE"])
+def invalidate_youtube_resolution(track_id):
+    """
+    Забуває знайдене для треку відео YouTube (невдалий збіг пошуку).
+    """
+    error = _admin_error()
+    if error:
+        return error
 
-    try:
-        db.session.commit()
-        print(f"💾 [INFO] Saved playlist analysis and all track features to DB for playlist {playlist_id}")
-    except IntegrityError:
-        db.session.rollback()
-        print(f"⚠️ [WARN] Playlist {playlist_id} already saved in parallel operation")
-        cached = AnalyzedPlaylist.query.filter_by(playlist_id=playlist_id).first()
-        return jsonify({
-            "playlist_id": playlist_id,
-            "feature_vector": json.loads(cached.features),
-            "consistency_score": cached.consistency_score,
-            "cached": True
-        })
+    deleted = invalidate_resolution(track_id)
+    stale = _forget_track_audio(track_id)
+    print(f"🧽 [INFO] Invalidated YouTube match for track {track_id} ({deleted} entries)")
+    return jsonify({"track_id": track_id, "invalidated": deleted, "stale_features": stale})
+
+@app.route("/youtube_resolution/<track_id>", methods=["PUT"])
+def pin_youtube_resolution(track_id):
+    """
+    Закріплює правильне відео для треку: {"video_id": "..."}.
+    """
+    error = _admin_error()
+    if error:
+        return error
+
+    video_id = (request.get_json(silent=True) or {}).get("video_id", "")
+    if not YOUTUBE_VIDEO_ID.match(video_id):
+        return jsonify({"error": "Invalid video_id"}), 400
+
+    invalidate_resolution(track_id)
+    pin_resolved_video(track_id, video_id)
+    stale = _forget_track_audio(track_id)
+    print(f"📌 [INFO] Pinned YouTube video {video_id} for track {track_id}")
+    return jsonify({"track_id": track_id, "video_id": video_id, "stale_features": stale})
+############## YouTube Resolution END ######################
+
+@app.route("/analysis/stats")
+def analysis_stats():
+    error = _admin_error()
+    if error:
+        return error
 
     return jsonify({
-        "playlist_id": playlist_id,
-        "track_features": [
-            {
-                "track_id": track["id"],
-                "track_name": track["name"],
-                "features": features_all[idx],
-                "cluster": int(analysis_results[idx]["cluster"]),
-                "tags": analysis_results[idx]["tags"]
-            }
-            for idx, track in enumerate(valid_tracks) if idx < len(features_all)
-        ],
-        "feature_vector": mean_features,
-        "consistency_score": consistency_score,
-        "track_names": [track["name"] for track in valid_tracks],
-        "cached": False,
-        "track_clusters": [int(result["cluster"]) for result in analysis_results]
+        "reccobeats_cache": cache_stats(),
+        "audio_cache": audio_cache_stats(),
+        "youtube_resolution": resolution_stats(),
+        "reccobeats_limiter": reccobeats_limiter.stats(),
+        "pipeline": pipeline_stats(),
+        "windows": window_stats(),
+        "streams": analysis_stream_stats(),
+        "feature_refresh": feature_refresh_stats()
     })
-############## Playlist Analyze END ######################
 
 ############## Artist Analyze ######################
 def get_spotify_headers():
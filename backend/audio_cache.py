@@ -0,0 +1,230 @@
+import os
+import re
+import json
+import uuid
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+from window_plan import analysed_span
+from analysis_tiers import DEFAULT_TIER, get_tier
+
+# Кеш завантаженого аудіо на диску за Spotify id треку: повторний аналіз (нова версія
+# екстрактора, інший рівень якості, збій Reccobeats) не йде знову на YouTube.
+# Зберігається рідний стиснутий потік (opus/m4a) як є. 0 — кеш вимкнено.
+AUDIO_CACHE_DIR = os.path.abspath(os.getenv("AUDIO_CACHE_DIR", "audio_cache"))
+AUDIO_CACHE_MAX_MB = float(os.getenv("AUDIO_CACHE_MAX_MB", "1024"))
+
+_LOCK_FILE = ".lock"
+_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def is_audio_cache_enabled():
+    return AUDIO_CACHE_MAX_MB > 0
+
+
+def _safe_key(track_id):
+    return re.sub(r"[^A-Za-z0-9_-]", "_", track_id)
+
+
+def _meta_path(track_id):
+    return os.path.join(AUDIO_CACHE_DIR, f"{_safe_key(track_id)}.json")
+
+
+@contextmanager
+def _cache_lock():
+    """
+    Міжпроцесний лок каталогу кешу (gunicorn-воркери, фоновий перерахунок).
+    """
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(AUDIO_CACHE_DIR, _LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _link_or_copy(src, dst):
+    # Жорстке посилання нічого не копіює; між файловими системами — звичайна копія
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _atomic_write_file(src, dst):
+    tmp = os.path.join(AUDIO_CACHE_DIR, f".tmp-{uuid.uuid4().hex}")
+    _link_or_copy(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _atomic_write_json(data, dst):
+    tmp = os.path.join(AUDIO_CACHE_DIR, f".tmp-{uuid.uuid4().hex}")
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, dst)
+
+
+def _covers(meta, tier):
+    """
+    Чи містить збережений файл усі вікна аналізу рівня tier.
+    """
+    if meta["span"] is None:
+        return True  # збережено весь трек
+
+    config = get_tier(tier)
+    required = analysed_span(meta["duration_ms"], config["chunk_length_ms"], config["n_windows"])
+    if required is None:
+        return False
+    start_ms, end_ms = meta["span"]
+    return start_ms <= required[0] and required[1] <= end_ms
+
+
+def get_cached_audio(track_id, out_dir="audio_temp", tier=DEFAULT_TIER):
+    """
+    Власна копія (жорстке посилання) аудіо треку з кешу в out_dir або None.
+    Викликач видаляє її сам; витіснення з кешу її не зачіпає.
+    """
+    if not is_audio_cache_enabled() or not track_id:
+        return None
+
+    try:
+        with _cache_lock():
+            meta_path = _meta_path(track_id)
+            if not os.path.exists(meta_path):
+                _count("misses")
+                return None
+
+            with open(meta_path) as f:
+                meta = json.load(f)
+            audio_path = os.path.join(AUDIO_CACHE_DIR, meta["file"])
+            if not os.path.exists(audio_path) or not _covers(meta, tier):
+                _count("misses")
+                return None
+
+            os.makedirs(out_dir, exist_ok=True)
+            out_path = os.path.join(out_dir, f"cached_{uuid.uuid4().hex}{os.path.splitext(meta['file'])[1]}")
+            _link_or_copy(audio_path, out_path)
+            os.utime(meta_path)  # час доступу для LRU
+    except Exception as e:
+        print(f"❌ [ERROR] Audio cache lookup failed for {track_id}: {e}")
+        return None
+
+    _count("hits")
+    print(f"💽 [INFO] Using cached audio for track {track_id}")
+    return out_path
+
+
+def store_cached_audio(track_id, path, duration_ms=None, span=None):
+    """
+    Кладе завантажений файл у кеш (атомарно, без копіювання, якщо це та сама файлова система).
+    span — відрізок треку (start_ms, end_ms), який містить файл, або None для всього треку.
+    Файл за path лишається у викликача.
+    """
+    if not is_audio_cache_enabled() or not track_id or not path:
+        return
+
+    key = _safe_key(track_id)
+    audio_name = f"{key}{os.path.splitext(path)[1]}"
+    try:
+        with _cache_lock():
+            meta_path = _meta_path(track_id)
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    old = json.load(f)
+                # Не замінюємо весь трек чи ширший відрізок вужчим
+                if old["span"] is None or (span is not None and old["span"][1] - old["span"][0] >= span[1] - span[0]):
+                    return
+                if old["file"] != audio_name:
+                    _remove_quietly(os.path.join(AUDIO_CACHE_DIR, old["file"]))
+
+            _atomic_write_file(path, os.path.join(AUDIO_CACHE_DIR, audio_name))
+            # Метадані пишуться останніми: їх наявність означає, що запис повний
+            _atomic_write_json({
+                "file": audio_name,
+                "duration_ms": duration_ms,
+                "span": list(span) if span is not None else None,
+            }, meta_path)
+            _count("stored")
+            _evict_over_limit()
+    except Exception as e:
+        print(f"❌ [ERROR] Cannot store audio of {track_id} in cache: {e}")
+
+
+def evict_cached_audio(track_id):
+    """
+    Видаляє аудіо треку з кешу (наприклад, завантажене з невірно знайденого відео).
+    """
+    if not is_audio_cache_enabled() or not os.path.isdir(AUDIO_CACHE_DIR):
+        return False
+
+    with _cache_lock():
+        meta_path = _meta_path(track_id)
+        if not os.path.exists(meta_path):
+            return False
+        try:
+            with open(meta_path) as f:
+                _remove_quietly(os.path.join(AUDIO_CACHE_DIR, json.load(f)["file"]))
+        except (OSError, ValueError, KeyError):
+            pass
+        _remove_quietly(meta_path)
+    _count("evicted")
+    return True
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _evict_over_limit():
+    """
+    Видаляє найдавніше використані записи, поки кеш більший за AUDIO_CACHE_MAX_MB.
+    Викликається під _cache_lock.
+    """
+    entries = []
+    total = 0
+    for name in os.listdir(AUDIO_CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        meta_path = os.path.join(AUDIO_CACHE_DIR, name)
+        try:
+            with open(meta_path) as f:
+                audio_path = os.path.join(AUDIO_CACHE_DIR, json.load(f)["file"])
+            size = os.path.getsize(audio_path)
+            entries.append((os.path.getmtime(meta_path), meta_path, audio_path, size))
+            total += size
+        except (OSError, ValueError, KeyError):
+            continue
+
+    limit = AUDIO_CACHE_MAX_MB * 1024 * 1024
+    evicted = 0
+    for _, meta_path, audio_path, size in sorted(entries):
+        if total <= limit:
+            break
+        _remove_quietly(meta_path)
+        _remove_quietly(audio_path)
+        total -= size
+        evicted += 1
+
+    if evicted:
+        _count("evicted", evicted)
+        print(f"🧹 [INFO] Evicted {evicted} track(s) from the audio cache")
+
+
+def audio_cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["max_mb"] = AUDIO_CACHE_MAX_MB
+    return stats
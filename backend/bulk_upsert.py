@@ -0,0 +1,30 @@
+from sqlalchemy.dialects.postgresql import insert
+from models import db
+
+# Postgres обмежує кількість параметрів в одному запиті (65535)
+UPSERT_BATCH_SIZE = 1000
+
+
+def upsert_rows(model, rows, conflict_columns):
+    """
+    Записує рядки (словники з однаковими ключами) одним INSERT ... ON CONFLICT DO UPDATE
+    на кожні UPSERT_BATCH_SIZE рядків. Коміт — на викликачу, щоб усе йшло однією транзакцією.
+    Рядки з однаковим ключем зводяться до останнього: Postgres не дозволяє
+    оновити той самий рядок двічі в одному запиті.
+    """
+    unique_rows = {tuple(row[c] for c in conflict_columns): row for row in rows}
+    rows = list(unique_rows.values())
+    if not rows:
+        return
+
+    update_columns = [c for c in rows[0] if c not in conflict_columns]
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        stmt = insert(model).values(rows[start:start + UPSERT_BATCH_SIZE])
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_columns,
+                set_={c: stmt.excluded[c] for c in update_columns},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_columns)
+        db.session.execute(stmt)
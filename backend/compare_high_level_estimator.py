@@ -0,0 +1,109 @@
+"""
+Порівняння локальної оцінки high-level фіч (high_level_estimator) з відповідями Reccobeats.
+
+Для кожного аудіофайлу вікна нарізаються так само, як у продакшені, еталон береться
+з кешу Reccobeats за хешем аудіо вікна (таблиця chunk_feature_cache), а з --fetch
+відсутні в кеші вікна додатково надсилаються в Reccobeats (і кешуються).
+
+    DATABASE_URL=... python compare_high_level_estimator.py audio_dir/ track.opus [--fetch] [--csv out.csv]
+"""
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+from db_app import database_url, create_db_app
+from reccobeats_cache import chunk_hash, get_cached_features
+from high_level_estimator import HIGH_LEVEL_FEATURES, estimate_high_level_features
+from features_extractor import (
+    load_audio_windows,
+    encode_window,
+    fetch_high_level_features_cached,
+    audio_buffer,
+)
+
+AUDIO_EXTENSIONS = (".opus", ".webm", ".m4a", ".mp3", ".wav", ".flac", ".ogg")
+
+
+def _audio_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def _compare_file(path, fetch):
+    """
+    Повертає список (reference, local) для вікон файлу, для яких є еталон.
+    """
+    windows, sr = load_audio_windows(path)
+    bodies = [encode_window(window, sr).getvalue() for window in windows]
+    cached = get_cached_features([chunk_hash(body) for body in bodies])
+
+    pairs = []
+    for window, body in zip(windows, bodies):
+        reference = cached.get(chunk_hash(body))
+        if reference is None and fetch:
+            reference = fetch_high_level_features_cached(body, lambda: audio_buffer(body))
+        if reference is None:
+            continue
+        pairs.append((np.asarray(reference, dtype=float), estimate_high_level_features(window, sr)))
+
+    print(f"🎧 {os.path.basename(path)}: {len(pairs)}/{len(windows)} window(s) with a Reccobeats reference")
+    return pairs
+
+
+def _report(reference, local):
+    print(f"\n{'feature':<18}{'MAE':>10}{'corr':>8}{'ref mean':>11}{'local mean':>12}")
+    rows = []
+    for idx, name in enumerate(HIGH_LEVEL_FEATURES):
+        ref, est = reference[:, idx], local[:, idx]
+        mae = float(np.mean(np.abs(ref - est)))
+        corr = float(np.corrcoef(ref, est)[0, 1]) if len(ref) > 1 and ref.std() > 0 and est.std() > 0 else float("nan")
+        rows.append({"feature": name, "mae": mae, "corr": corr, "ref_mean": float(ref.mean()), "local_mean": float(est.mean())})
+        print(f"{name:<18}{mae:>10.4f}{corr:>8.3f}{ref.mean():>11.4f}{est.mean():>12.4f}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="audio files or directories")
+    parser.add_argument("--fetch", action="store_true", help="query Reccobeats for windows missing from the cache")
+    parser.add_argument("--csv", help="write per-window reference/local values to this CSV file")
+    args = parser.parse_args()
+
+    if not database_url():
+        sys.exit("DATABASE_URL is not set: the Reccobeats cache is needed as the reference")
+    app = create_db_app(__name__)
+    pairs, window_files = [], []
+    with app.app_context():
+        for path in _audio_files(args.paths):
+            try:
+                file_pairs = _compare_file(path, args.fetch)
+            except Exception as e:
+                print(f"❌ [ERROR] Failed to analyze {path}: {e}")
+                continue
+            pairs += file_pairs
+            window_files += [path] * len(file_pairs)
+
+    if not pairs:
+        sys.exit("No windows with a Reccobeats reference (run with --fetch to query the API)")
+
+    reference = np.array([ref for ref, _ in pairs])
+    local = np.array([est for _, est in pairs])
+    _report(reference, local)
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file"] + [f"ref_{n}" for n in HIGH_LEVEL_FEATURES] + [f"local_{n}" for n in HIGH_LEVEL_FEATURES])
+            for path, ref, est in zip(window_files, reference, local):
+                writer.writerow([path] + ref.round(4).tolist() + est.round(4).tolist())
+        print(f"\n💾 Saved {len(pairs)} window(s) to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+from flask import Flask
+from models import db
+
+
+def database_url():
+    """
+    DATABASE_URL з оточення у вигляді, який приймає SQLAlchemy
+    (Render/Heroku видають схему postgres://). None, якщо змінна не задана.
+    """
+    url = os.getenv("DATABASE_URL")
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def create_db_app(name):
+    """
+    Мінімальний Flask-застосунок лише з підключенням до БД — для CLI-скриптів,
+    яким не потрібні маршрути, сесії і фонові сервіси app.py.
+    """
+    app = Flask(name)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    return app
@@ -0,0 +1,251 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+
+# Кеш скомпільованих numba-функцій librosa на диску, щоб нові процеси
+# не компілювали їх заново. Має бути задано до імпорту librosa у воркерах.
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.abspath("numba_cache"))
+
+import numpy as np
+from yt_download_audio import search_audio, download_resolved_audio, cache_downloaded_audio
+from audio_cache import get_cached_audio
+from features_extractor import (
+    SAMPLE_RATE,
+    HIGH_LEVEL_BACKEND,
+    reccobeats_limiter,
+    analyze_distinct_windows,
+    fetch_windows_high_level_features,
+    window_feature_matrix,
+    extract_low_level_features_many,
+    encode_window,
+)
+from high_level_estimator import estimate_high_level_features
+from pipeline import Stage, Pipeline
+from window_aggregation import aggregate_windows
+from analysis_tiers import DEFAULT_TIER
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1))
+# Мережеві стадії не впираються в CPU, тож потоків там більше навіть на одному ядрі
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Скільки вікон було заплановано і скільки реально проаналізовано (для /analysis/stats)
+_window_totals = {"tracks": 0, "planned": 0, "processed": 0}
+_window_lock = threading.Lock()
+
+
+def _warm_up_worker():
+    """
+    Ініціалізатор воркер-процесу: проганяє екстракцію на синтетичному сигналі,
+    щоб numba/librosa скомпілювали все до першого справжнього треку.
+    """
+    rng = np.random.default_rng(0)
+    windows = [
+        (0.1 * rng.standard_normal(SAMPLE_RATE * 3)).astype(np.float32),
+        (0.1 * rng.standard_normal(SAMPLE_RATE * 2)).astype(np.float32),
+    ]
+    extract_low_level_features_many(windows, SAMPLE_RATE)
+    encode_window(windows[0], SAMPLE_RATE)
+    if HIGH_LEVEL_BACKEND == "local":
+        estimate_high_level_features(windows[0], SAMPLE_RATE)
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def get_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                # spawn: gunicorn-воркер багатопотоковий, fork з потоками небезпечний
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up_worker,
+            )
+        return _pool
+
+
+def start_extraction_pool():
+    """
+    Запускає і прогріває всі процеси пулу у фоні. Викликається один раз на воркер.
+    """
+    if multiprocessing.parent_process() is not None:
+        return  # ми самі в дочірньому процесі пулу
+
+    pool = get_extraction_pool()
+    for _ in range(EXTRACTION_WORKERS):
+        pool.submit(_worker_pid)
+    print(f"🔥 [INFO] Warming up {EXTRACTION_WORKERS} extraction worker(s)")
+
+
+def _restart_broken_pool(broken):
+    """
+    Прибирає зламаний пул. Кілька потоків можуть отримати BrokenProcessPool від
+    одного пулу одночасно — перестворює його лише перший, решта беруть новий.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return
+        print("⚠️ [WARN] Extraction pool is broken, restarting it")
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def run_in_pool(fn, *args):
+    pool = get_extraction_pool()
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        # Воркер упав (наприклад, OOM) — перестворюємо пул і пробуємо ще раз
+        _restart_broken_pool(pool)
+        return get_extraction_pool().submit(fn, *args).result()
+
+
+def _search_stage(task):
+    track = task["track"]
+    name, artist = track["name"], track["artists"][0]["name"]
+    print(f"🎧 [INFO] Processing track '{name}' by {artist}")
+
+    # Аудіо вже є в локальному кеші — ні пошуку, ні завантаження
+    cached = get_cached_audio(track["id"], tier=task["tier"])
+    if cached:
+        task["path"] = cached
+        return task
+
+    info = search_audio(name, artist, tier=task["tier"], track_id=track["id"])
+    if not info:
+        print(f"⚠️ [WARN] No audio found for track '{name}'")
+        return None
+    task["info"] = info
+    return task
+
+
+def _download_stage(task):
+    if "path" in task:
+        return task  # взято з кешу аудіо
+
+    info = task.pop("info")
+    path = download_resolved_audio(info, tier=task["tier"])
+    if not path:
+        print(f"⚠️ [WARN] Failed to download audio for track '{task['track']['name']}'")
+        return None
+    cache_downloaded_audio(task["track"]["id"], info, path, tier=task["tier"])
+    task["path"] = path
+    return task
+
+
+def _decode_stage(task):
+    name = task["track"]["name"]
+    path = task.pop("path")
+    try:
+        print(f"🔍 [DEBUG] Decoding analysis windows for '{name}' from {path}")
+        # Локальна оцінка high-level фіч — у тому ж виклику пулу, щоб PCM вікон не ходив між процесами
+        (task["n_windows"], task["low_level"], task["bodies"],
+         task["high_level"], task["n_candidates"]) = run_in_pool(
+            analyze_distinct_windows, path, HIGH_LEVEL_BACKEND == "local", task["tier"]
+        )
+    finally:
+        try:
+            os.remove(path)
+            print(f"🗑️ [INFO] Deleted temporary audio file for track '{name}'")
+        except Exception as e:
+            print(f"❌ [ERROR] Cannot remove {path}: {e}")
+    return task
+
+
+def _remote_stage(task):
+    bodies = task.pop("bodies")
+    if HIGH_LEVEL_BACKEND == "local":
+        return task  # high-level фічі вже оцінені локально у стадії декодування
+
+    task["high_level"] = fetch_windows_high_level_features(bodies)
+    if all(feats is None for feats in task["high_level"]):
+        print(f"⚠️ [WARN] Skipping track '{task['track']['name']}': no high-level features")
+        return None
+    return task
+
+
+def _aggregate_stage(task):
+    name = task["track"]["name"]
+    matrix = window_feature_matrix(task.pop("high_level"), task.pop("low_level"))
+    if matrix is None:
+        print(f"⚠️ [WARN] Skipping track '{name}' due to failed extraction")
+        return None
+
+    # Вікна зберігаються окремо, щоб спосіб зведення можна було змінити без повторного аналізу
+    task["window_features"] = matrix
+    feats = aggregate_windows(matrix[np.newaxis])[0]
+
+    n_windows = task["n_windows"]
+    with _window_lock:
+        _window_totals["tracks"] += 1
+        _window_totals["planned"] += task["n_candidates"]
+        _window_totals["processed"] += n_windows
+
+    print(f"🎯 [INFO] Extracted features for track '{name}' ({n_windows}/{task['n_candidates']} windows)")
+    return feats.tolist()
+
+
+def window_stats():
+    """
+    Економія від відбору вікон: скільки вікон заплановано рівнями якості
+    і скільки з них реально проаналізовано.
+    """
+    with _window_lock:
+        stats = dict(_window_totals)
+    stats["saved"] = stats["planned"] - stats["processed"]
+    stats["avg_per_track"] = round(stats["processed"] / stats["tracks"], 2) if stats["tracks"] else None
+    return stats
+
+
+def _analysis_stages():
+    return [
+        Stage("search", _search_stage, workers=DOWNLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("download", _download_stage, workers=DOWNLOAD_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("decode", _decode_stage, workers=EXTRACTION_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("remote_features", _remote_stage, workers=reccobeats_limiter.max_in_flight,
+              queue_size=PIPELINE_QUEUE_SIZE),
+        Stage("aggregate", _aggregate_stage, workers=1, queue_size=PIPELINE_QUEUE_SIZE),
+    ]
+
+
+def extract_tracks_features(tracks, on_track_done=None, tier=DEFAULT_TIER):
+    """
+    Аналізує треки конвеєром: пошук → завантаження → декодування і low-level фічі →
+    Reccobeats → зведення вікон.
+    Стадії з'єднані обмеженими чергами, тож поки трек N аналізується, трек N+1 завантажується;
+    мережа (YouTube, Reccobeats) — у потоках, декодування і librosa — у прогрітому пулі процесів.
+    on_track_done(track, features, n_windows) викликається з потоку, щойно трек оброблено
+    (features = None — не вдалося; n_windows — скільки вікон реально проаналізовано).
+    tier — рівень якості аналізу (вікна і частота дискретизації, див. analysis_tiers).
+    Повертає список (track, features, window_features) для успішних треків у вихідному порядку,
+    де window_features — матриця (n_windows, n_features) фіч окремих вікон.
+    """
+    os.makedirs("audio_temp", exist_ok=True)
+
+    # Кожен потік отримує власний контекст застосунку (і власну сесію БД) для кешу Reccobeats
+    app = current_app._get_current_object() if has_app_context() else None
+
+    pipeline = Pipeline(
+        _analysis_stages(),
+        on_result=(lambda task, feats: on_track_done(task["track"], feats, task["n_windows"])) if on_track_done else None,
+        on_drop=(lambda task: on_track_done(task["track"], None)) if on_track_done else None,
+        context=app.app_context if app is not None else None,
+    )
+    tasks = [{"track": track, "tier": tier} for track in tracks]
+    results = pipeline.run(tasks)
+
+    return [
+        (task["track"], feats, task["window_features"])
+        for task, feats in zip(tasks, results)
+        if feats is not None
+    ]
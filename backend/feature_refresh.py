@@ -0,0 +1,290 @@
+import os
+import time
+import threading
+from sqlalchemy import or_
+from models import db, TrackFeature
+from features_extractor import EXTRACTOR_VERSION, FEATURE_PARAMS
+from extraction_pool import extract_tracks_features
+from track_store import save_track_features
+from analysis_service import (
+    ANALYSIS_TARGETS,
+    AnalysisError,
+    is_stale,
+    flush_views,
+    sync_track_vectors_from_store,
+    reanalyze_from_store,
+)
+from analysis_jobs import find_active_job
+from analysis_locks import advisory_lock, analysis_run_lock
+
+# Частка часу, яку фоновий перерахунок може бути зайнятий (0 — вимкнено).
+# Після пачки тривалістю t потік спить t * (1 - budget) / budget, тому значення обмежене до 1.
+FEATURE_REFRESH_CPU_BUDGET = min(float(os.getenv("FEATURE_REFRESH_CPU_BUDGET", "0.25")), 1.0)
+FEATURE_REFRESH_BATCH_SIZE = int(os.getenv("FEATURE_REFRESH_BATCH_SIZE", "5"))
+FEATURE_REFRESH_IDLE_SEC = int(os.getenv("FEATURE_REFRESH_IDLE_SEC", "600"))
+# Трек, який не вдалося перерахувати (немає аудіо тощо), не пробуємо знову цей час
+FEATURE_REFRESH_RETRY_SEC = int(os.getenv("FEATURE_REFRESH_RETRY_SEC", str(6 * 3600)))
+
+# Як часто пробувати знову, коли пачку обробляє інший воркер
+FEATURE_REFRESH_LOCK_RETRY_SEC = 30
+
+_app = None
+_wakeup = threading.Event()
+_lock = threading.Lock()
+_requested = []  # (kind, target_id, tier), які щойно віддали застарілими — обробляються першими
+_failed_until = {}  # (kind, id, tier) треку чи аналізу -> monotonic-час наступної спроби
+_stats = {"tracks_refreshed": 0, "tracks_failed": 0, "analyses_refreshed": 0, "busy_sec": 0.0}
+
+
+def init_feature_refresh(app):
+    """
+    Запускає фоновий потік перерахунку застарілих фіч для цього воркера.
+    """
+    global _app
+    if FEATURE_REFRESH_CPU_BUDGET <= 0:
+        print("⏸️ [INFO] Background feature refresh is disabled")
+        return
+
+    _app = app
+    threading.Thread(target=_refresh_loop, daemon=True, name="feature-refresh").start()
+    print(f"🔄 [INFO] Background feature refresh started (extractor v{EXTRACTOR_VERSION}, "
+          f"budget {FEATURE_REFRESH_CPU_BUDGET:.0%})")
+
+
+def request_refresh(kind, target_id, tier):
+    """
+    Застарілий аналіз щойно віддали користувачу — перераховуємо його поза чергою.
+    """
+    with _lock:
+        if (kind, target_id, tier) not in _requested:
+            _requested.append((kind, target_id, tier))
+    _wakeup.set()
+
+
+def mark_track_stale(track_id):
+    """
+    Фічі треку пораховані з неправильного аудіо: вектор у сховищі й аналізи, куди трек
+    входить, позначаються застарілими — фоновий перерахунок оновить їх першими серед рівних.
+    """
+    updated = TrackFeature.query.filter(TrackFeature.track_id == track_id).update(
+        {"extractor_version": 0}, synchronize_session=False
+    )
+    for kind, target in ANALYSIS_TARGETS.items():
+        model, track_model = target["summary_model"], target["track_model"]
+        id_field = target["id_field"]
+        containing = db.session.query(getattr(track_model, id_field), track_model.tier).filter(
+            track_model.track_id == track_id
+        )
+        for target_id, tier in containing.all():
+            model.query.filter(getattr(model, id_field) == target_id, model.tier == tier).update(
+                {"extractor_version": 0}, synchronize_session=False
+            )
+            request_refresh(kind, target_id, tier)
+    db.session.commit()
+    _wakeup.set()
+    return updated
+
+
+def feature_refresh_stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["requested"] = len(_requested)
+    stats["busy_sec"] = round(stats["busy_sec"], 1)
+    stats["extractor_version"] = EXTRACTOR_VERSION
+    stats["feature_params"] = FEATURE_PARAMS
+    stats["enabled"] = _app is not None
+    return stats
+
+
+def _is_failed(key):
+    until = _failed_until.get(key)
+    return until is not None and until > time.monotonic()
+
+
+def _mark_failed(key):
+    _failed_until[key] = time.monotonic() + FEATURE_REFRESH_RETRY_SEC
+
+
+def _stale_condition(model=TrackFeature):
+    # Старша версія екстрактора або інші налаштування фіч (наприклад, HIGH_LEVEL_BACKEND)
+    return or_(
+        model.extractor_version.is_(None),
+        model.extractor_version < EXTRACTOR_VERSION,
+        model.feature_params.is_(None),
+        model.feature_params != FEATURE_PARAMS,
+    )
+
+
+def _next_stale_target():
+    """
+    Наступний застарілий аналіз: спершу щойно запитані, далі за кількістю переглядів.
+    """
+    while True:
+        with _lock:
+            if not _requested:
+                break
+            kind, target_id, tier = _requested.pop(0)
+        summary = db.session.get(ANALYSIS_TARGETS[kind]["summary_model"], (target_id, tier))
+        if summary is None or not is_stale(summary) or _is_failed((kind, target_id, tier)):
+            continue
+        if not find_active_job(kind, target_id, tier):
+            return kind, target_id, tier
+
+    candidates = []
+    for kind, target in ANALYSIS_TARGETS.items():
+        model = target["summary_model"]
+        id_column = getattr(model, target["id_field"])
+        rows = (
+            db.session.query(id_column, model.tier, model.view_count)
+            .filter(_stale_condition(model))
+            .order_by(model.view_count.desc())
+            .limit(50)
+            .all()
+        )
+        candidates += [(view_count, kind, target_id, tier) for target_id, tier, view_count in rows]
+
+    for _, kind, target_id, tier in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if _is_failed((kind, target_id, tier)) or find_active_job(kind, target_id, tier):
+            continue
+        return kind, target_id, tier
+    return None
+
+
+def _stale_tracks(kind, target_id, tier):
+    """
+    Треки аналізу, вектори яких у сховищі старіші за поточний екстрактор (або відсутні).
+    """
+    target = ANALYSIS_TARGETS[kind]
+    track_model = target["track_model"]
+    rows = (
+        db.session.query(track_model.track_id, track_model.track_name, TrackFeature.artist_name)
+        .outerjoin(TrackFeature, (TrackFeature.track_id == track_model.track_id) & (TrackFeature.tier == tier))
+        .filter(getattr(track_model, target["id_field"]) == target_id, track_model.tier == tier, _stale_condition())
+        .all()
+    )
+    return [row for row in rows if not _is_failed(("track", row.track_id, tier))]
+
+
+def _orphan_stale_tracks(limit):
+    """
+    Решта застарілих треків сховища, поза застарілими аналізами (найстаріші першими).
+    """
+    rows = (
+        db.session.query(TrackFeature.track_id, TrackFeature.track_name, TrackFeature.artist_name, TrackFeature.tier)
+        .filter(_stale_condition())
+        .order_by(TrackFeature.created_at)
+        .limit(limit)
+        .all()
+    )
+    return [row for row in rows if not _is_failed(("track", row.track_id, row.tier))]
+
+
+def _reextract(rows, tier):
+    """
+    Заново аналізує аудіо треків і зберігає вектори поточної версії в сховище.
+    """
+    tracks = [
+        {"id": row.track_id, "name": row.track_name, "artists": [{"name": row.artist_name}]}
+        for row in rows
+        if row.track_name and row.artist_name
+    ]
+    extracted = extract_tracks_features(tracks, tier=tier) if tracks else []
+    save_track_features(extracted, tier)
+
+    done = {track["id"] for track, _, _ in extracted}
+    failed = [row.track_id for row in rows if row.track_id not in done]
+    for track_id in failed:
+        _mark_failed(("track", track_id, tier))
+
+    with _lock:
+        _stats["tracks_refreshed"] += len(done)
+        _stats["tracks_failed"] += len(failed)
+    return done
+
+
+def _refresh_target(kind, target_id, tier):
+    # Задача аналізу того ж альбому/плейлиста могла стартувати в іншому воркері
+    with analysis_run_lock(kind, target_id, tier) as acquired:
+        if acquired:
+            _refresh_target_locked(kind, target_id, tier)
+
+
+def _refresh_target_locked(kind, target_id, tier):
+    stale = _stale_tracks(kind, target_id, tier)
+    if stale:
+        batch = stale[:FEATURE_REFRESH_BATCH_SIZE]
+        print(f"🔄 [INFO] Refreshing {len(batch)}/{len(stale)} stale track(s) of {kind} {target_id} ({tier})")
+        _reextract(batch, tier)
+        if len(stale) > len(batch):
+            # Решту треків — наступними пачками, між ними діє бюджет
+            with _lock:
+                _requested.insert(0, (kind, target_id, tier))
+            return
+
+    # Усі треки, які вдалося, оновлені — перераховуємо підсумок аналізу з векторів
+    target = ANALYSIS_TARGETS[kind]
+    track_model = target["track_model"]
+    track_ids = [
+        track_id for (track_id,) in db.session.query(track_model.track_id)
+        .filter(getattr(track_model, target["id_field"]) == target_id, track_model.tier == tier)
+        .all()
+    ]
+    sync_track_vectors_from_store(kind, track_ids, tier)
+    try:
+        reanalyze_from_store(kind, target_id, tier)
+    except AnalysisError as e:
+        print(f"❌ [ERROR] Cannot refresh {kind} {target_id}: {e}")
+
+    summary = db.session.get(target["summary_model"], (target_id, tier), populate_existing=True)
+    if summary is None or is_stale(summary):
+        # Частину треків перерахувати не вдалося — аналіз лишається застарілим до наступної спроби
+        _mark_failed((kind, target_id, tier))
+    with _lock:
+        _stats["analyses_refreshed"] += 1
+    print(f"✅ [INFO] Refreshed {kind} {target_id} ({tier}) to extractor v{EXTRACTOR_VERSION}")
+
+
+def _refresh_next_batch():
+    """
+    Одна пачка роботи. Повертає False, якщо застарілих даних не лишилось.
+    """
+    target = _next_stale_target()
+    if target is not None:
+        _refresh_target(*target)
+        return True
+
+    orphans = _orphan_stale_tracks(FEATURE_REFRESH_BATCH_SIZE * 4)[:FEATURE_REFRESH_BATCH_SIZE]
+    if not orphans:
+        return False
+
+    print(f"🔄 [INFO] Refreshing {len(orphans)} stale track(s) from the feature store")
+    for tier in {row.tier for row in orphans}:
+        _reextract([row for row in orphans if row.tier == tier], tier)
+    return True
+
+
+def _refresh_loop():
+    while True:
+        started = time.monotonic()
+        with _app.app_context():
+            try:
+                flush_views()  # пріоритет пачки рахується за свіжими лічильниками переглядів
+                # Потік працює в кожному gunicorn-воркері, але пачку обробляє лише один з них
+                with advisory_lock("feature_refresh", wait=False) as acquired:
+                    worked = _refresh_next_batch() if acquired else None
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ [ERROR] Background feature refresh failed: {e}")
+                worked = False
+        elapsed = time.monotonic() - started
+        with _lock:
+            _stats["busy_sec"] += elapsed
+
+        _wakeup.clear()
+        if worked:
+            time.sleep(max(elapsed * (1 - FEATURE_REFRESH_CPU_BUDGET) / FEATURE_REFRESH_CPU_BUDGET, 0))
+        elif worked is None:
+            # Пачку обробляє інший воркер — наші запитані аналізи візьмемо після нього
+            _wakeup.wait(FEATURE_REFRESH_LOCK_RETRY_SEC)
+        else:
+            _wakeup.wait(FEATURE_REFRESH_IDLE_SEC)
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Вектори фіч зберігаються в БД як упакований little-endian float32 (4 байти на значення)
+FEATURE_DTYPE = np.dtype("<f4")
+
+
+def pack_features(features):
+    return np.asarray(features, dtype=FEATURE_DTYPE).tobytes()
+
+
+def unpack_features(blob):
+    return np.frombuffer(blob, dtype=FEATURE_DTYPE)
+
+
+def unpack_matrix(blobs):
+    """
+    Вектори кількох рядків одним масивом (n, n_features) без розбору кожного рядка окремо.
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=FEATURE_DTYPE)
+    return np.frombuffer(b"".join(blobs), dtype=FEATURE_DTYPE).reshape(len(blobs), -1)
+
+
+def unpack_windows(blobs, counts):
+    """
+    Вектори вікон кількох треків одним масивом (n_tracks, max_windows, n_features);
+    у треків з меншою кількістю вікон решта заповнена NaN.
+    """
+    counts = np.asarray(counts, dtype=np.intp)
+    if not len(blobs):
+        return np.empty((0, 0, 0), dtype=FEATURE_DTYPE)
+
+    flat = np.frombuffer(b"".join(blobs), dtype=FEATURE_DTYPE).reshape(int(counts.sum()), -1)
+    stacked = np.full((len(counts), int(counts.max()), flat.shape[1]), np.nan, dtype=FEATURE_DTYPE)
+
+    # Номер треку і номер вікна в ньому для кожного рядка flat
+    track_idx = np.repeat(np.arange(len(counts)), counts)
+    window_idx = np.arange(len(flat)) - np.repeat(np.cumsum(counts) - counts, counts)
+    stacked[track_idx, window_idx] = flat
+    return stacked
+
+
+def features_to_list(features, decimals=4):
+    """
+    Вектор для JSON-відповіді. Округлення прибирає шум float32
+    (значення до упаковки і так округлені до 4-5 знаків).
+    """
+    return np.round(np.asarray(features, dtype=np.float64), decimals).tolist()
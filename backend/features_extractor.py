@@ -1,62 +1,373 @@
+import io
 import os
+import json
+import hashlib
+import shutil
+import subprocess
+from functools import lru_cache
 import requests
 import time
 import librosa
 import numpy as np
-from pydub import AudioSegment
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from window_plan import CHUNK_LENGTH_MS, N_WINDOWS, plan_windows
+from reccobeats_cache import chunk_hash, get_cached_features, store_features
+from high_level_estimator import estimate_high_level_features
+from analysis_tiers import DEFAULT_TIER, get_tier
+from calculate_consistency_score import min_vector, max_vector
+from window_aggregation import WINDOW_AGGREGATION, TRIM_MIN_WINDOWS
 
-def split_audio_to_chunks(file_path, chunk_length_ms=30000):
-    audio = AudioSegment.from_file(file_path)
-    duration = len(audio)
+SAMPLE_RATE = 22050
+
+# Версія екстрактора: збільшується з кожною зміною, що змінює збережені вектори
+# (дескриптори, параметри STFT, вікна, зведення вікон). Рядки старших версій
+# віддаються як є, а фоновий перерахунок (feature_refresh.py) поступово їх оновлює.
+EXTRACTOR_VERSION = 1
+RECCOBEATS_URL = "https://api.reccobeats.com/v1/analysis/audio-features"
+
+# Джерело 9 high-level фіч: "reccobeats" (API) або "local" (high_level_estimator, без мережі)
+HIGH_LEVEL_BACKEND = os.getenv("HIGH_LEVEL_BACKEND", "reccobeats")
+
+# Додаткові вікна аналізуються повністю (Reccobeats / оцінка high-level), лише якщо їхні low-level
+# фічі відрізняються від уже вибраних більше за поріг: RMS різниці після мін-макс нормалізації
+# (межі ті самі, що в consistency score). 0 — аналізувати всі вікна, крім точних копій.
+WINDOW_DISTINCT_THRESHOLD = float(os.getenv("WINDOW_DISTINCT_THRESHOLD", "0.1"))
+N_HIGH_LEVEL = 9
+
+# Стеля пам'яті на декодування вікон одного треку, МБ (ділиться між вікнами;
+# вікна, що не влазять у свою частку, обрізаються навколо свого центру)
+DECODE_MEMORY_LIMIT_MB = float(os.getenv("DECODE_MEMORY_LIMIT_MB", "128"))
+
+
+def feature_params_hash(**overrides):
+    """
+    Відбиток налаштувань (env), від яких залежать збережені вектори. Зберігається поруч
+    з EXTRACTOR_VERSION: рядок з іншим відбитком застарілий, навіть якщо версія та сама.
+    DECODE_MEMORY_LIMIT_MB сюди не входить: стеля змінює лише вікна, які довелося обрізати,
+    і її зміна не повинна робити застарілою (і перезавантажувати) всю бібліотеку.
+    overrides — значення, з якими вектори порахували насправді (наприклад, інше зведення вікон).
+    """
+    params = {
+        "high_level_backend": HIGH_LEVEL_BACKEND,
+        "window_distinct_threshold": WINDOW_DISTINCT_THRESHOLD,
+        "window_aggregation": WINDOW_AGGREGATION,
+    }
+    params.update(overrides)
+    if params["window_aggregation"] == "trimmed_mean":
+        # trimmed_mean до появи TRIM_MIN_WINDOWS не обрізав вікна коротких треків
+        params["trim_min_windows"] = TRIM_MIN_WINDOWS
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+FEATURE_PARAMS = feature_params_hash()
+FFMPEG_PATH = os.path.abspath("./ffmpeg/bin")
+
+# Спільний ліміт для всіх запитів до Reccobeats у процесі
+reccobeats_limiter = AdaptiveRateLimiter(
+    rate=float(os.getenv("RECCOBEATS_RATE", "1.0")),
+    burst=int(os.getenv("RECCOBEATS_BURST", "3")),
+    max_in_flight=int(os.getenv("RECCOBEATS_MAX_IN_FLIGHT", "3")),
+)
+
+def load_audio_pcm(file_path, sr=SAMPLE_RATE):
+    """
+    Декодує весь трек у моно PCM (float32) один раз.
+    """
+    y, sr = librosa.load(file_path, sr=sr, mono=True)
+    return y, sr
+
+
+def probe_audio(file_path):
+    """
+    Тривалість (мс), рідна частота, кількість каналів без декодування файлу і чи читає
+    файл soundfile (wav/flac/ogg — з точним seek).
+    """
+    try:
+        info = sf.info(file_path)
+        return int(info.duration * 1000), info.samplerate, info.channels, True
+    except Exception:
+        # opus/m4a soundfile не читає: тривалість з метаданих, решта — типові значення
+        return int(librosa.get_duration(path=file_path) * 1000), 48000, 2, False
+
+
+def _ffmpeg_binary():
+    # Локальна збірка (як у yt_download_audio) або системний ffmpeg
+    search_path = os.pathsep.join([FFMPEG_PATH, os.environ.get("PATH", "")])
+    return shutil.which("ffmpeg", path=search_path)
+
+
+def _decode_segment_ffmpeg(ffmpeg, file_path, sr, start_ms, end_ms):
+    """
+    Декодує відрізок через ffmpeg з -ss перед -i: ffmpeg переходить до start_ms
+    за індексом контейнера, а не декодує файл від початку.
+    Повертає моно float32 у частоті sr.
+    """
+    command = [
+        ffmpeg, "-nostdin", "-v", "error",
+        "-ss", f"{start_ms / 1000:.3f}", "-t", f"{(end_ms - start_ms) / 1000:.3f}",
+        "-i", file_path,
+        "-f", "f32le", "-ac", "1", "-ar", str(sr), "-",
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def _decode_segment(file_path, sr, start_ms, end_ms, seekable):
+    if not seekable:
+        ffmpeg = _ffmpeg_binary()
+        if ffmpeg:
+            return _decode_segment_ffmpeg(ffmpeg, file_path, sr, start_ms, end_ms)
+        # Без ffmpeg librosa піде через audioread: пам'ять теж обмежена вікном,
+        # але декодування йде з початку файлу до offset
+        print(f"⚠️ [WARN] ffmpeg not found, decoding {file_path} from the start")
+
+    y, _ = librosa.load(file_path, sr=sr, mono=True, offset=start_ms / 1000, duration=(end_ms - start_ms) / 1000)
+    return y
+
+
+def _decode_bytes_per_second(native_sr, channels, sr, seekable=True):
+    if not seekable and _ffmpeg_binary():
+        # ffmpeg сам зводить у моно й ресемплує: лише результат і його копія з pipe
+        return sr * 4 * 2
+    # Декодований фрагмент у рідній частоті (float32, усі канали, з копією при склеюванні)
+    # плюс ресемплований моно-результат
+    return native_sr * channels * 4 * 2 + sr * 4
+
+
+def _fit_windows_to_memory_limit(windows, native_sr, channels, sr, seekable=True):
+    # Стеля на весь трек: декодовані вікна лишаються в пам'яті, поки декодуються наступні
+    budget = DECODE_MEMORY_LIMIT_MB * 1024 * 1024 / len(windows)
+    max_ms = int(budget / _decode_bytes_per_second(native_sr, channels, sr, seekable) * 1000)
+
+    fitted = []
+    for start, end in windows:
+        if end - start > max_ms:
+            print(f"✂️ [WARN] Window {start}-{end} ms trimmed to {max_ms} ms by DECODE_MEMORY_LIMIT_MB")
+            center = (start + end) // 2
+            start, end = center - max_ms // 2, center + max_ms // 2
+        fitted.append((start, end))
+    return fitted
+
+
+def load_audio_windows(file_path, sr=SAMPLE_RATE, chunk_length_ms=CHUNK_LENGTH_MS, n_windows=N_WINDOWS):
+    """
+    Декодує лише вікна аналізу (seek через soundfile або ffmpeg -ss), а не весь файл,
+    тож пікова пам'ять обмежена розміром вікна (DECODE_MEMORY_LIMIT_MB) незалежно від
+    тривалості треку.
+    """
+    duration_ms, native_sr, channels, seekable = probe_audio(file_path)
+    if duration_ms <= 0:
+        # Тривалість невідома — лишається тільки повне декодування
+        y, sr = load_audio_pcm(file_path, sr)
+        return split_pcm_to_windows(y, sr, chunk_length_ms, n_windows), sr
+
+    windows = _fit_windows_to_memory_limit(
+        plan_windows(duration_ms, chunk_length_ms, n_windows), native_sr, channels, sr, seekable
+    )
+
+    result = []
+    for start, end in windows:
+        y = _decode_segment(file_path, sr, start, end, seekable)
+        if len(y):
+            result.append(y)
+    return result, sr
+
+
+def split_pcm_to_windows(y, sr, chunk_length_ms=CHUNK_LENGTH_MS, n_windows=N_WINDOWS):
+    """
+    Розбивка вже декодованого треку на вікна аналізу (plan_windows) без копіювання:
+    повертає numpy-зрізи (views) вже декодованого буфера.
+    """
+    duration = len(y) * 1000 // sr
 
     if duration <= chunk_length_ms:
-        chunk_path = f"{file_path}_chunk_0.mp3"
-        audio.export(chunk_path, format="mp3")
-        return [chunk_path]
+        return [y]
+
+    return [
+        y[start * sr // 1000:end * sr // 1000]
+        for start, end in plan_windows(duration, chunk_length_ms, n_windows)
+    ]
+
+
+def encode_window(y, sr, audio_format="WAV"):
+    """
+    Кодує вікно PCM у буфер у пам'яті для завантаження в Reccobeats.
+    """
+    buffer = io.BytesIO()
+    sf.write(buffer, y, sr, format=audio_format, subtype="PCM_16")
+    buffer.seek(0)
+    buffer.name = f"chunk.{audio_format.lower()}"  # requests бере ім'я файлу звідси
+    return buffer
+
+
+def audio_buffer(body, name="chunk.wav"):
+    """
+    Обгортає вже закодоване тіло (bytes) у file-like об'єкт для requests.
+    """
+    buffer = io.BytesIO(body)
+    buffer.name = name
+    return buffer
+
+
+class Spectrogram:
+    """
+    STFT вікна (або пачки вікон форми (n, samples)), обчислене один раз
+    і спільне для всіх дескрипторів.
+    Похідні представлення (спектр потужності) рахуються ліниво й кешуються.
+    """
+    def __init__(self, y, sr=SAMPLE_RATE, n_fft=2048, hop_length=512):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.magnitude = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+        self._power = None
+
+    @property
+    def power(self):
+        if self._power is None:
+            self._power = self.magnitude ** 2
+        return self._power
+
+
+# Дескриптори приймають Spectrogram з довільними провідними вимірами
+# і повертають середнє по часу форми (..., k) — окремо для кожного вікна.
+
+def mfcc_descriptor(spec, n_mfcc=13, top_db=80.0):
+    mel = librosa.feature.melspectrogram(S=spec.power, sr=spec.sr)
+    # power_to_db обрізає top_db від глобального максимуму масиву,
+    # тому для пачки вікон поріг рахуємо для кожного вікна окремо
+    mel_db = librosa.power_to_db(mel, top_db=None)
+    mel_db = np.maximum(mel_db, mel_db.max(axis=(-2, -1), keepdims=True) - top_db)
+    mfccs = librosa.feature.mfcc(S=mel_db, n_mfcc=n_mfcc)
+    return np.mean(mfccs, axis=-1)
+
 
-    center = duration // 2
-    offsets = [-chunk_length_ms, 0, chunk_length_ms]
+@lru_cache(maxsize=64)
+def _chroma_filter(sr, n_fft, tuning):
+    return librosa.filters.chroma(sr=sr, n_fft=n_fft, tuning=tuning)
 
-    chunks = []
-    for i, offset in enumerate(offsets):
-        start = max(center + offset - chunk_length_ms // 2, 0)
-        end = min(start + chunk_length_ms, duration)
-        chunk = audio[start:end]
 
-        chunk_path = f"{file_path}_chunk_{i}.mp3"
-        chunk.export(chunk_path, format="mp3")
-        chunks.append(chunk_path)
+def chroma_descriptor(spec):
+    power = spec.power
+    frames = power.reshape(-1, *power.shape[-2:])
 
-    return chunks
+    # Підлаштування строю оцінюється для кожного вікна окремо (як у chroma_stft),
+    # а банк фільтрів застосовується одним einsum для всіх вікон з однаковим строєм
+    tunings = np.array([
+        librosa.estimate_tuning(S=frame, sr=spec.sr, bins_per_octave=12) for frame in frames
+    ])
+    # Розкладка (n, T, 12) -> (n, 12, T) повторює порядок пам'яті einsum у chroma_stft,
+    # щоб усереднення по часу давало ті самі біти, що й виклик для одного вікна
+    raw_chroma = np.empty((frames.shape[0], frames.shape[-1], 12), dtype=frames.dtype).transpose(0, 2, 1)
+    for tuning in np.unique(tunings):
+        idx = np.flatnonzero(tunings == tuning)
+        chromafb = _chroma_filter(spec.sr, spec.n_fft, float(tuning))
+        raw_chroma[idx] = np.einsum("cf,...ft->...ct", chromafb, frames[idx], optimize=True)
 
+    chroma = librosa.util.normalize(raw_chroma, norm=np.inf, axis=-2)
+    return np.mean(chroma, axis=-1).reshape(*power.shape[:-2], 12)
 
-def extract_low_level_features(file_path):
-    y, sr = librosa.load(file_path, sr=22050, mono=True, duration=30)
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-    mfccs_mean = np.mean(mfccs, axis=1)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    chroma_mean = np.mean(chroma, axis=1)
-    contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-    contrast_mean = np.mean(contrast, axis=1)
 
-    low_level_feats = np.concatenate([mfccs_mean, chroma_mean, contrast_mean])
-    return low_level_feats
+def contrast_descriptor(spec):
+    contrast = librosa.feature.spectral_contrast(S=spec.magnitude, sr=spec.sr)
+    return np.mean(contrast, axis=-1)
 
 
-def extract_audio_features(file_path, max_retries=3, retry_delay=5):
-    url = "https://api.reccobeats.com/v1/analysis/audio-features"
+# Порядок визначає розкладку вектора: 13 MFCC + 12 chroma + 7 contrast
+DEFAULT_DESCRIPTORS = [
+    ("mfcc", mfcc_descriptor),
+    ("chroma", chroma_descriptor),
+    ("contrast", contrast_descriptor),
+]
+
+
+class LowLevelFeatureExtractor:
+    """
+    Рахує одну спектрограму на вікно і передає її всім дескрипторам.
+    Нові дескриптори (функція spec -> вектор) додаються без додаткових STFT.
+    """
+    def __init__(self, sr=SAMPLE_RATE, n_fft=2048, hop_length=512, descriptors=None):
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.descriptors = list(descriptors if descriptors is not None else DEFAULT_DESCRIPTORS)
+
+    def add_descriptor(self, name, fn):
+        self.descriptors.append((name, fn))
+
+    def spectrogram(self, y):
+        return Spectrogram(y, sr=self.sr, n_fft=self.n_fft, hop_length=self.hop_length)
+
+    def extract(self, y):
+        """
+        y — одне вікно (samples,) або пачка (n, samples) однакової довжини.
+        Повертає вектор (32,) або матрицю (n, 32) для стандартних дескрипторів.
+        """
+        spec = self.spectrogram(y)
+        return np.concatenate([fn(spec) for _, fn in self.descriptors], axis=-1)
+
+
+low_level_extractor = LowLevelFeatureExtractor()
+
+
+def _get_extractor(sr):
+    return low_level_extractor if sr == low_level_extractor.sr else LowLevelFeatureExtractor(sr=sr)
+
+
+def extract_low_level_features_from_pcm(y, sr=SAMPLE_RATE):
+    return _get_extractor(sr).extract(y)
+
+
+def extract_low_level_features_batch(windows, sr=SAMPLE_RATE):
+    """
+    Пакетна екстракція: windows — 2-D масив (n_windows, n_samples) вікон
+    однакової довжини (можуть бути з різних треків).
+    Повертає матрицю (n_windows, 32) за один векторизований прохід.
+    """
+    windows = np.atleast_2d(np.asarray(windows, dtype=np.float32))
+    return _get_extractor(sr).extract(windows)
+
+
+def extract_low_level_features_many(windows, sr=SAMPLE_RATE):
+    """
+    Для вікон різної довжини: групує за довжиною і рахує кожну групу пакетно.
+    Повертає матрицю (len(windows), 32) у вихідному порядку.
+    """
+    by_length = {}
+    for i, window in enumerate(windows):
+        by_length.setdefault(len(window), []).append(i)
+
+    result = None
+    for indices in by_length.values():
+        feats = extract_low_level_features_batch(np.stack([windows[i] for i in indices]), sr)
+        if result is None:
+            result = np.empty((len(windows), feats.shape[1]), dtype=feats.dtype)
+        result[indices] = feats
+
+    return result
+
+
+def fetch_high_level_features(open_audio, max_retries=3, retry_delay=5):
+    """
+    Надсилає аудіо в Reccobeats і повертає 9 high-level фіч.
+    open_audio — функція, що повертає свіжий file-like об'єкт для кожної спроби.
+    """
     retries = 0
     while retries < max_retries:
         try:
-            with open(file_path, 'rb') as f:
-                files = {'audioFile': f}
-                response = requests.post(url, files=files)
+            with reccobeats_limiter.slot():
+                with open_audio() as f:
+                    files = {'audioFile': f}
+                    response = requests.post(RECCOBEATS_URL, files=files)
 
             if response.status_code == 200:
+                reccobeats_limiter.on_success()
                 data = response.json()
                 print(f"📈 [INFO] Reccobeats returned features: {data}")
 
-                high_level_feats = np.array([
+                return np.array([
                     data["acousticness"],
                     data["danceability"],
                     data["energy"],
@@ -68,14 +379,11 @@ def extract_audio_features(file_path, max_retries=3, retry_delay=5):
                     data["valence"]
                 ])
 
-                low_level_feats = extract_low_level_features(file_path)
-                combined_feats = np.concatenate([high_level_feats, low_level_feats])
-                return combined_feats
-
             elif response.status_code == 429:
-                retry_after = int(response.headers.get("Retry-After", retry_delay))
+                # Не спимо тут: лімітер притримає наступний запит (і всі інші) сам
+                retry_after = parse_retry_after(response.headers.get("Retry-After"), retry_delay)
+                reccobeats_limiter.on_rate_limited(retry_after)
                 print(f"⚠️ Rate limited by API. Retrying after {retry_after} seconds...")
-                time.sleep(retry_after)
                 retries += 1
             else:
                 print(f"❌ [ERROR] API error {response.status_code}: {response.text}")
@@ -90,27 +398,131 @@ def extract_audio_features(file_path, max_retries=3, retry_delay=5):
     return None
 
 
-def extract_features_from_full_track(file_path, delay_sec=1.0):
-    chunk_paths = split_audio_to_chunks(file_path)
-    features_list = []
+def fetch_high_level_features_cached(body, open_audio, max_retries=3, retry_delay=5):
+    """
+    fetch_high_level_features з кешем за хешем аудіо (body — байти вікна).
+    """
+    h = chunk_hash(body)
+    cached = get_cached_features([h])
+    if h in cached:
+        return cached[h]
 
-    for chunk_path in chunk_paths:
-        feats = extract_audio_features(chunk_path)
-        if feats is not None:
-            features_list.append(feats.tolist())
-        else:
-            print(f"⚠️ Failed to extract features from chunk {chunk_path}")
+    high_level_feats = fetch_high_level_features(open_audio, max_retries=max_retries, retry_delay=retry_delay)
+    if high_level_feats is not None:
+        store_features({h: high_level_feats})
+    return high_level_feats
+
+
+def decode_track_windows(file_path, encode=True, tier=DEFAULT_TIER):
+    """
+    Стадія декодування: PCM вікон аналізу рівня tier і (якщо encode) їх WAV-тіла для Reccobeats.
+    """
+    config = get_tier(tier)
+    windows, sr = load_audio_windows(
+        file_path, sr=config["sample_rate"], chunk_length_ms=config["chunk_length_ms"], n_windows=config["n_windows"]
+    )
+    bodies = [encode_window(window, sr).getvalue() for window in windows] if encode else None
+    return windows, sr, bodies
+
+
+def select_distinct_windows(low_level_feats, threshold=WINDOW_DISTINCT_THRESHOLD):
+    """
+    Індекси вікон, які варто аналізувати повністю. Центральне вікно береться завжди,
+    кожне інше — лише якщо воно відрізняється від усіх уже вибраних більше ніж на threshold.
+    """
+    scale = max_vector[N_HIGH_LEVEL:] - min_vector[N_HIGH_LEVEL:]
+    normalized = np.asarray(low_level_feats) / scale
+
+    center = len(normalized) // 2
+    selected = [center]
+    for i in range(len(normalized)):
+        if i == center:
+            continue
+        distances = np.sqrt(np.mean((normalized[selected] - normalized[i]) ** 2, axis=1))
+        if distances.min() > threshold:
+            selected.append(i)
+
+    return sorted(selected)
+
+
+def decode_distinct_windows(file_path, encode=True, tier=DEFAULT_TIER):
+    """
+    Стадія декодування з відбором вікон: low-level фічі рахуються одним пакетом для всіх
+    вікон-кандидатів рівня tier (вони ж і дешевий дескриптор для порівняння), далі лишаються
+    лише помітно різні вікна, і тільки їх тіла кодуються для Reccobeats.
+    Повертає (windows, sr, bodies, low_level_feats, n_candidates) для вибраних вікон.
+    """
+    windows, sr, _ = decode_track_windows(file_path, encode=False, tier=tier)
+    if not windows:
+        return [], sr, [] if encode else None, None, 0
+
+    low_level_feats = extract_low_level_features_many(windows, sr)
+    selected = select_distinct_windows(low_level_feats)
+
+    windows = [windows[i] for i in selected]
+    bodies = [encode_window(window, sr).getvalue() for window in windows] if encode else None
+    return windows, sr, bodies, low_level_feats[selected], len(low_level_feats)
 
-        try:
-            os.remove(chunk_path)
-            print(f"🗑️ Removed temporary chunk: {chunk_path}")
-        except Exception as e:
-            print(f"❌ [ERROR] Cannot remove chunk {chunk_path}: {e}")
 
-        time.sleep(delay_sec)
+def estimate_windows_high_level(windows, sr):
+    """
+    Локальна оцінка high-level фіч для кожного вікна (HIGH_LEVEL_BACKEND=local).
+    """
+    return [estimate_high_level_features(window, sr) for window in windows]
+
+
+def analyze_distinct_windows(file_path, estimate_locally=False, tier=DEFAULT_TIER):
+    """
+    CPU-частина аналізу треку для воркер-процесу: декодування, відбір вікон, low-level фічі і
+    або закодовані тіла вікон для Reccobeats, або (estimate_locally) локальна оцінка high-level фіч.
+    PCM вікон лишається у воркері — назад передаються лише фічі й тіла.
+    Повертає (n_windows, low_level_feats, bodies, high_level_list, n_candidates);
+    bodies = None при локальній оцінці, high_level_list = None для Reccobeats.
+    """
+    windows, sr, bodies, low_level_feats, n_candidates = decode_distinct_windows(
+        file_path, encode=not estimate_locally, tier=tier
+    )
+    high_level_list = estimate_windows_high_level(windows, sr) if estimate_locally else None
+    return len(windows), low_level_feats, bodies, high_level_list, n_candidates
+
+
+def fetch_windows_high_level_features(bodies):
+    """
+    High-level фічі для закодованих вікон. Вікна, які вже є в кеші за хешем аудіо,
+    не надсилаються; решта йде в Reccobeats паралельно (темп задає reccobeats_limiter).
+    None на місці вікна, що не вдалося.
+    """
+    if not bodies:
+        return []
+
+    hashes = [chunk_hash(body) for body in bodies]
+    known = get_cached_features(hashes)
+    # Однакові вікна в межах одного треку теж надсилаються лише раз
+    missing = {h: body for h, body in zip(hashes, bodies) if h not in known}
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+            fetched = list(executor.map(
+                lambda body: fetch_high_level_features(lambda: audio_buffer(body)), missing.values()
+            ))
+        fetched = {h: feats for h, feats in zip(missing, fetched) if feats is not None}
+        store_features(fetched)
+        known.update(fetched)
+
+    return [known.get(h) for h in hashes]
+
+
+def window_feature_matrix(high_level_list, low_level_feats):
+    """
+    Склеює high-level і low-level фічі кожного вікна: матриця (n_windows, n_features).
+    Вікна без відповіді Reccobeats пропускаються; None, якщо не лишилось жодного.
+    """
+    features_list = [
+        np.concatenate([high_level_feats, low_level_feats[i]])
+        for i, high_level_feats in enumerate(high_level_list)
+        if high_level_feats is not None
+    ]
 
     if not features_list:
         return None
-
-    mean_features = np.mean(features_list, axis=0)
-    return np.round(mean_features, 4)
+    return np.array(features_list)
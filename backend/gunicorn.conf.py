@@ -0,0 +1,8 @@
+# Налаштування gunicorn (файл підхоплюється автоматично з робочої директорії).
+
+
+def post_worker_init(worker):
+    # Застосунок уже завантажено у воркер: запускаємо його фонові сервіси
+    # (задачі аналізу, перерахунок фіч, пул екстракції) окремо в кожному воркері
+    from app import start_background_services
+    start_background_services()
@@ -0,0 +1,138 @@
+import numpy as np
+import librosa
+
+# Порядок і шкали такі самі, як у відповіді Reccobeats
+HIGH_LEVEL_FEATURES = [
+    "acousticness",
+    "danceability",
+    "energy",
+    "instrumentalness",
+    "liveness",
+    "loudness",
+    "speechiness",
+    "tempo",
+    "valence",
+]
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# Смуга голосу і частота складів для оцінки вокалу/мовлення
+VOICE_BAND_HZ = (300, 3400)
+SYLLABLE_RATE_HZ = (2.0, 8.0)
+HIGH_BAND_HZ = 4000
+
+# Мажорний і мінорний профілі тональностей (Krumhansl-Kessler)
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _clip01(value):
+    return float(np.clip(value, 0.0, 1.0))
+
+
+def _band_ratio(power, freqs, low_hz, high_hz=None):
+    band = freqs >= low_hz if high_hz is None else (freqs >= low_hz) & (freqs < high_hz)
+    return float(power[band].sum() / (power.sum() + 1e-10))
+
+
+def _pulse_clarity(onset_env, sr, hop_length):
+    """
+    Наскільки чіткий біт: висота найбільшого піку автокореляції огинаючої онсетів
+    в діапазоні 60–200 BPM відносно нульового лагу.
+    """
+    if len(onset_env) < 4:
+        return 0.0
+    env = onset_env - onset_env.mean()
+    ac = librosa.autocorrelate(env)
+    if ac[0] <= 0:
+        return 0.0
+    frame_rate = sr / hop_length
+    lo, hi = int(frame_rate * 60 / 200), int(frame_rate * 60 / 60)
+    lags = ac[lo:min(hi, len(ac))]
+    return float(lags.max() / ac[0]) if len(lags) else 0.0
+
+
+def _syllabic_modulation(power, freqs, sr, hop_length):
+    """
+    Частка енергії модуляцій огинаючої голосової смуги на частоті складів (2–8 Гц)
+    та глибина цієї модуляції. Мовлення і вокал дають сильну модуляцію, інструменти — слабшу.
+    """
+    band = (freqs >= VOICE_BAND_HZ[0]) & (freqs < VOICE_BAND_HZ[1])
+    envelope = np.sqrt(power[band].sum(axis=0))
+    if len(envelope) < 8 or envelope.mean() <= 0:
+        return 0.0, 0.0
+
+    spectrum = np.abs(np.fft.rfft(envelope - envelope.mean())) ** 2
+    mod_freqs = np.fft.rfftfreq(len(envelope), d=hop_length / sr)
+    syllabic = (mod_freqs >= SYLLABLE_RATE_HZ[0]) & (mod_freqs < SYLLABLE_RATE_HZ[1])
+    ratio = float(spectrum[syllabic].sum() / (spectrum[1:].sum() + 1e-10))
+    depth = float(envelope.std() / envelope.mean())
+    return ratio, depth
+
+
+def _mode_score(chroma):
+    """
+    +1 — явний мажор, -1 — явний мінор (найкраща кореляція з профілями по всіх тоніках).
+    """
+    profile = chroma.mean(axis=1)
+    if not np.any(profile):
+        return 0.0
+    major = max(np.corrcoef(profile, np.roll(MAJOR_PROFILE, k))[0, 1] for k in range(12))
+    minor = max(np.corrcoef(profile, np.roll(MINOR_PROFILE, k))[0, 1] for k in range(12))
+    return float(np.clip((major - minor) * 5, -1.0, 1.0))
+
+
+def estimate_high_level_features(y, sr, n_fft=N_FFT, hop_length=HOP_LENGTH):
+    """
+    Локальна оцінка 9 high-level фіч (в порядку і шкалах Reccobeats) з PCM одного вікна.
+    Це евристики на основі одного STFT: темп — з огинаючої онсетів, гучність — RMS у dBFS,
+    вокал/мовлення — з модуляції голосової смуги, настрій — з тональності, темпу і яскравості.
+    Точність відносно Reccobeats перевіряється скриптом compare_high_level_estimator.py.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if y.size < n_fft:
+        y = np.pad(y, (0, n_fft - y.size))
+
+    power = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length)) ** 2
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+
+    # Гучність: середня потужність сигналу в dBFS (Reccobeats: приблизно -60..0)
+    loudness = float(np.clip(10 * np.log10(np.mean(y ** 2) + 1e-10), -60.0, 0.0))
+    loudness_norm = _clip01((loudness + 30) / 25)
+
+    mel = librosa.feature.melspectrogram(S=power, sr=sr)
+    onset_env = librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr)
+    tempo = float(librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=hop_length)[0])
+    pulse = _pulse_clarity(onset_env, sr, hop_length)
+    onset_density = _clip01(onset_env.mean() / 2.0)
+
+    centroid = librosa.feature.spectral_centroid(S=np.sqrt(power), sr=sr)[0]
+    brightness = _clip01(np.mean(centroid) / 4000)
+    high_ratio = _band_ratio(power, freqs, HIGH_BAND_HZ)
+    flatness = float(np.mean(librosa.feature.spectral_flatness(S=np.sqrt(power))))
+
+    syllabic_ratio, modulation_depth = _syllabic_modulation(power, freqs, sr, hop_length)
+    mode = _mode_score(librosa.feature.chroma_stft(S=power, sr=sr, tuning=0.0))
+
+    tempo_fit = float(np.exp(-((tempo - 120) / 45) ** 2))
+
+    energy = _clip01(0.55 * loudness_norm + 0.25 * brightness + 0.2 * onset_density)
+    danceability = _clip01(0.25 + 0.45 * pulse + 0.3 * tempo_fit - 0.15 * flatness)
+    acousticness = _clip01(1.1 - 0.7 * energy - 3.0 * high_ratio)
+    speechiness = _clip01(0.03 + 1.2 * max(syllabic_ratio - 0.3, 0.0) * min(modulation_depth, 1.0))
+    instrumentalness = _clip01(1.0 - 2.5 * syllabic_ratio * min(modulation_depth * 1.5, 1.0))
+    liveness = _clip01(0.08 + 0.6 * flatness + 0.1 * (1 - pulse))
+    valence = _clip01(0.45 + 0.2 * mode + 0.15 * (tempo_fit - 0.5) + 0.25 * (brightness - 0.4) + 0.15 * (energy - 0.5))
+
+    return np.array([
+        acousticness,
+        danceability,
+        energy,
+        instrumentalness,
+        liveness,
+        loudness,
+        speechiness,
+        tempo,
+        valence,
+    ])
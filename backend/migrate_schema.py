@@ -0,0 +1,24 @@
+"""
+Міграція схеми БД: нові таблиці й колонки, первинні ключі з рівнем якості,
+перенесення JSON-векторів у float32. Запускається один раз перед стартом gunicorn
+(див. DockerFile і Procfile), а не в кожному воркері під час імпорту app.py.
+
+    DATABASE_URL=... python migrate_schema.py
+"""
+import sys
+from db_app import database_url, create_db_app
+from schema import ensure_schema
+
+
+def main():
+    if not database_url():
+        sys.exit("DATABASE_URL is not set")
+
+    app = create_db_app(__name__)
+    with app.app_context():
+        ensure_schema()
+    print("🗄️ [INFO] Database schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,40 +21,110 @@ class UserLyricsTopic(db.Model):
 
 class AnalyzedAlbum(db.Model):
     album_id = db.Column(db.String(128), primary_key=True)
-    features = db.Column(db.Text)  # збережені фічі про трек у вигляді JSON для альбомів
+    tier = db.Column(db.String(16), primary_key=True, default="standard")  # рівень якості аналізу (analysis_tiers)
+    features = db.Column(db.Text, nullable=True)  # застаріле: JSON до міграції у features_vec
+    features_vec = db.Column(db.LargeBinary, nullable=True)  # вектор фіч як упакований float32 (див. feature_vectors.py)
     consistency_score = db.Column(db.Float, nullable=True)
+    response_gz = db.Column(db.LargeBinary, nullable=True)  # готова відповідь API (gzip JSON)
+    response_etag = db.Column(db.String(64), nullable=True)
+    extractor_version = db.Column(db.Integer, nullable=False, default=0)  # найстаріша версія екстрактора серед треків
+    feature_params = db.Column(db.String(16), nullable=True)  # відбиток налаштувань фіч треків (features_extractor.FEATURE_PARAMS), "mixed" — різні
+    high_level_backend = db.Column(db.String(16), nullable=True)  # features_extractor.HIGH_LEVEL_BACKEND, яким пораховані вектори треків
+    view_count = db.Column(db.Integer, nullable=False, default=0)  # скільки разів аналіз віддано (пріоритет фонового перерахунку)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 class AlbumTrackFeature(db.Model):
     __table_args__ = (
-        db.PrimaryKeyConstraint('album_id', 'track_id'),
+        db.PrimaryKeyConstraint('album_id', 'track_id', 'tier'),
     )
     album_id = db.Column(db.String(128), nullable=False)
     track_id = db.Column(db.String(128), nullable=False)
+    tier = db.Column(db.String(16), nullable=False, default="standard")  # рівень якості аналізу (analysis_tiers)
     track_name = db.Column(db.String(256), nullable=True)
-    features = db.Column(db.Text)  # JSON у текстовому вигляді
+    features = db.Column(db.Text, nullable=True)  # застаріле: JSON до міграції у features_vec
+    features_vec = db.Column(db.LargeBinary, nullable=True)  # вектор фіч як упакований float32 (див. feature_vectors.py)
     cluster = db.Column(db.Integer, nullable=True)
     tags = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 class AnalyzedPlaylist(db.Model):
     playlist_id = db.Column(db.String(128), primary_key=True)
-    features = db.Column(db.Text)  # збережені фічі про трек у вигляді JSON для плейлистів
+    tier = db.Column(db.String(16), primary_key=True, default="standard")  # рівень якості аналізу (analysis_tiers)
+    features = db.Column(db.Text, nullable=True)  # застаріле: JSON до міграції у features_vec
+    features_vec = db.Column(db.LargeBinary, nullable=True)  # вектор фіч як упакований float32 (див. feature_vectors.py)
     consistency_score = db.Column(db.Float, nullable=True)
+    snapshot_id = db.Column(db.String(128), nullable=True)  # snapshot_id плейлиста в Spotify на момент аналізу
+    track_ids = db.Column(db.Text, nullable=True)  # JSON: запитані треки плейлиста, включно з тими, що не вдалося проаналізувати
+    response_gz = db.Column(db.LargeBinary, nullable=True)  # готова відповідь API (gzip JSON)
+    response_etag = db.Column(db.String(64), nullable=True)
+    extractor_version = db.Column(db.Integer, nullable=False, default=0)  # найстаріша версія екстрактора серед треків
+    feature_params = db.Column(db.String(16), nullable=True)  # відбиток налаштувань фіч треків (features_extractor.FEATURE_PARAMS), "mixed" — різні
+    high_level_backend = db.Column(db.String(16), nullable=True)  # features_extractor.HIGH_LEVEL_BACKEND, яким пораховані вектори треків
+    view_count = db.Column(db.Integer, nullable=False, default=0)  # скільки разів аналіз віддано (пріоритет фонового перерахунку)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
 class PlaylistTrackFeature(db.Model):
     __table_args__ = (
-        db.PrimaryKeyConstraint('playlist_id', 'track_id'),
+        db.PrimaryKeyConstraint('playlist_id', 'track_id', 'tier'),
     )
     playlist_id = db.Column(db.String(128), nullable=False)
     track_id = db.Column(db.String(128), nullable=False)
+    tier = db.Column(db.String(16), nullable=False, default="standard")  # рівень якості аналізу (analysis_tiers)
     track_name = db.Column(db.String(256), nullable=True)
-    features = db.Column(db.Text)  # JSON у текстовому вигляді
+    features = db.Column(db.Text, nullable=True)  # застаріле: JSON до міграції у features_vec
+    features_vec = db.Column(db.LargeBinary, nullable=True)  # вектор фіч як упакований float32 (див. feature_vectors.py)
     cluster = db.Column(db.Integer, nullable=True)
     tags = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
 
+class TrackFeature(db.Model):
+    # Фічі треку незалежно від альбому/плейлиста — спільне сховище для обох аналізів
+    track_id = db.Column(db.String(128), primary_key=True)
+    tier = db.Column(db.String(16), primary_key=True, default="standard")  # рівень якості аналізу (analysis_tiers)
+    track_name = db.Column(db.String(256), nullable=True)
+    artist_name = db.Column(db.String(256), nullable=True)
+    features = db.Column(db.Text, nullable=True)  # застаріле: JSON до міграції у features_vec
+    features_vec = db.Column(db.LargeBinary, nullable=True)  # вектор фіч як упакований float32 (див. feature_vectors.py)
+    window_features = db.Column(db.LargeBinary, nullable=True)  # фічі окремих вікон (n_windows, n_features), float32
+    n_windows = db.Column(db.SmallInteger, nullable=True)
+    extractor_version = db.Column(db.Integer, nullable=False, default=0)  # features_extractor.EXTRACTOR_VERSION на момент аналізу
+    feature_params = db.Column(db.String(16), nullable=True)  # features_extractor.FEATURE_PARAMS на момент аналізу
+    high_level_backend = db.Column(db.String(16), nullable=True)  # features_extractor.HIGH_LEVEL_BACKEND; вектори іншого бекенду не перевикористовуються
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class YoutubeResolution(db.Model):
+    # Відео YouTube, знайдене для треку Spotify за пошуковим запитом — повторний аналіз не шукає знову
+    track_id = db.Column(db.String(128), primary_key=True)
+    search_query = db.Column(db.String(512), primary_key=True)
+    video_id = db.Column(db.String(32), nullable=False)
+    title = db.Column(db.String(512), nullable=True)
+    pinned = db.Column(db.Boolean, nullable=False, default=False)  # задано вручну, TTL не діє
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class ChunkFeatureCache(db.Model):
+    # Відповіді Reccobeats за хешем аудіо вікна — однакові вікна не надсилаються двічі
+    chunk_hash = db.Column(db.String(64), primary_key=True)
+    features = db.Column(db.Text)  # JSON з 9 high-level фічами
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    last_used_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), index=True)
+
+class AnalysisJob(db.Model):
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    kind = db.Column(db.String(16), nullable=False)  # "album" або "playlist"
+    target_id = db.Column(db.String(128), nullable=False, index=True)
+    state = db.Column(db.String(16), nullable=False, default="queued")  # queued / running / done / failed
+    tracks = db.Column(db.Text)  # JSON: треки зі Spotify, які треба проаналізувати
+    snapshot_id = db.Column(db.String(128), nullable=True)  # для плейлистів
+    tier = db.Column(db.String(16), nullable=False, default="standard")  # рівень якості аналізу (analysis_tiers)
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Text, nullable=True)  # JSON: стан кожного треку
+    result = db.Column(db.Text, nullable=True)  # JSON відповіді після завершення
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
+
 class Rating(db.Model):
     __tablename__ = "ratings"
     id = db.Column(db.Integer, primary_key=True)
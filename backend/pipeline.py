@@ -0,0 +1,178 @@
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import nullcontext
+
+_STOP = object()
+THROUGHPUT_WINDOW_SEC = 60
+
+# Сумарна статистика стадій по всіх конвеєрах процесу (для /analysis/stats)
+_stage_totals = {}
+_active_pipelines = set()
+_stats_lock = threading.Lock()
+
+
+class Stage:
+    """
+    Стадія конвеєра: fn(payload) повертає payload для наступної стадії
+    або None, якщо елемент відкидається (помилка вже залогована у fn).
+    """
+    def __init__(self, name, fn, workers=1, queue_size=2):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+
+
+def _totals(name):
+    if name not in _stage_totals:
+        _stage_totals[name] = {
+            "processed": 0,
+            "dropped": 0,
+            "busy_sec": 0.0,
+            "completed_at": deque(maxlen=1000),
+        }
+    return _stage_totals[name]
+
+
+class Pipeline:
+    """
+    Стадії з'єднані обмеженими чергами: поки трек N аналізується, трек N+1 уже
+    завантажується, а черги не дають швидкій стадії набрати в пам'ять забагато
+    роботи для повільної. context — фабрика контекст-менеджера для кожного потоку
+    (наприклад, app.app_context).
+    """
+    def __init__(self, stages, on_result=None, on_drop=None, context=None):
+        self.stages = stages
+        self.on_result = on_result
+        self.on_drop = on_drop
+        self.context = context or nullcontext
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.busy = [0] * len(stages)
+
+        self._items = []
+        self._results = []
+        self._remaining = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _finish(self, idx, result):
+        item = self._items[idx]
+        self._results[idx] = result
+        try:
+            if result is None:
+                if self.on_drop:
+                    self.on_drop(item)
+            elif self.on_result:
+                self.on_result(item, result)
+        except Exception as e:
+            print(f"❌ [ERROR] Pipeline callback failed: {e}")
+
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.set()
+
+    def _worker(self, stage_idx):
+        stage = self.stages[stage_idx]
+        is_last = stage_idx == len(self.stages) - 1
+
+        with self.context():
+            while True:
+                task = self.queues[stage_idx].get()
+                if task is _STOP:
+                    return
+                idx, payload = task
+
+                with _stats_lock:
+                    self.busy[stage_idx] += 1
+                started = time.monotonic()
+                try:
+                    result = stage.fn(payload)
+                except Exception as e:
+                    print(f"❌ [ERROR] Pipeline stage '{stage.name}' failed: {e}")
+                    result = None
+                elapsed = time.monotonic() - started
+
+                with _stats_lock:
+                    self.busy[stage_idx] -= 1
+                    totals = _totals(stage.name)
+                    totals["busy_sec"] += elapsed
+                    if result is None:
+                        totals["dropped"] += 1
+                    else:
+                        totals["processed"] += 1
+                        totals["completed_at"].append(time.monotonic())
+
+                if result is None or is_last:
+                    self._finish(idx, result)
+                else:
+                    self.queues[stage_idx + 1].put((idx, result))
+
+    def run(self, items):
+        """
+        Проганяє елементи через усі стадії. Повертає результати останньої стадії
+        у вихідному порядку (None для відкинутих елементів).
+        """
+        self._items = list(items)
+        self._results = [None] * len(self._items)
+        self._remaining = len(self._items)
+        if not self._items:
+            return []
+
+        threads = [
+            threading.Thread(target=self._worker, args=(stage_idx,), daemon=True,
+                             name=f"pipeline-{stage.name}-{n}")
+            for stage_idx, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        with _stats_lock:
+            _active_pipelines.add(self)
+        try:
+            # Блокується, коли перша черга повна — треки подаються в темпі конвеєра
+            for idx, item in enumerate(self._items):
+                self.queues[0].put((idx, item))
+            self._done.wait()
+        finally:
+            with _stats_lock:
+                _active_pipelines.discard(self)
+            for stage_idx, stage in enumerate(self.stages):
+                for _ in range(stage.workers):
+                    self.queues[stage_idx].put(_STOP)
+            for thread in threads:
+                thread.join()
+
+        return self._results
+
+
+def pipeline_stats():
+    """
+    По кожній стадії: глибина вхідної черги і зайняті потоки (по активних конвеєрах),
+    оброблені/відкинуті елементи, середній час на елемент і пропускна здатність
+    за останню хвилину.
+    """
+    now = time.monotonic()
+    with _stats_lock:
+        stats = {}
+        for name, totals in _stage_totals.items():
+            handled = totals["processed"] + totals["dropped"]
+            stats[name] = {
+                "queued": 0,
+                "busy": 0,
+                "processed": totals["processed"],
+                "dropped": totals["dropped"],
+                "avg_sec": round(totals["busy_sec"] / handled, 3) if handled else None,
+                "per_min": sum(1 for t in totals["completed_at"] if now - t <= THROUGHPUT_WINDOW_SEC),
+            }
+        for pipeline in _active_pipelines:
+            for stage_idx, stage in enumerate(pipeline.stages):
+                entry = stats.setdefault(stage.name, {
+                    "queued": 0, "busy": 0, "processed": 0, "dropped": 0, "avg_sec": None, "per_min": 0,
+                })
+                entry["queued"] += pipeline.queues[stage_idx].qsize()
+                entry["busy"] += pipeline.busy[stage_idx]
+        return {"active_pipelines": len(_active_pipelines), "stages": stats}
@@ -0,0 +1,69 @@
+"""
+Перерахунок векторів треків зі збережених фіч окремих вікон — без повторного
+завантаження й аналізу аудіо (наприклад, після зміни WINDOW_AGGREGATION).
+
+Оновлюються вектори в спільному сховищі, у рядках альбомів/плейлистів, а також
+кластери, центроїди, consistency score і готові відповіді зачеплених аналізів.
+
+    DATABASE_URL=... python reaggregate_features.py --method median [--tier full]
+    DATABASE_URL=... python reaggregate_features.py --method trimmed_mean --album ID --playlist ID
+"""
+import sys
+import argparse
+from models import db
+from db_app import database_url, create_db_app
+from analysis_tiers import ANALYSIS_TIERS, DEFAULT_TIER
+from window_aggregation import AGGREGATIONS, WINDOW_AGGREGATION
+from analysis_service import ANALYSIS_TARGETS, AnalysisError, sync_track_vectors_from_store, reanalyze_from_store
+from track_store import reaggregate_track_features
+
+
+def _target_track_ids(kind, target_ids, tier):
+    target = ANALYSIS_TARGETS[kind]
+    track_model = target["track_model"]
+    rows = (
+        db.session.query(track_model.track_id)
+        .filter(getattr(track_model, target["id_field"]).in_(target_ids), track_model.tier == tier)
+        .all()
+    )
+    return {track_id for (track_id,) in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--method", choices=list(AGGREGATIONS), default=WINDOW_AGGREGATION,
+                        help="how window vectors are combined into a track vector")
+    parser.add_argument("--tier", choices=list(ANALYSIS_TIERS), default=DEFAULT_TIER)
+    parser.add_argument("--album", action="append", default=[], help="album id (repeatable)")
+    parser.add_argument("--playlist", action="append", default=[], help="playlist id (repeatable)")
+    args = parser.parse_args()
+
+    if args.method != WINDOW_AGGREGATION:
+        # Вектори позначаються відбитком з цим методом; з іншим WINDOW_AGGREGATION на сервері
+        # фоновий перерахунок вважатиме їх застарілими і зведе вікна знову по-своєму
+        print(f"⚠️ [WARN] Set WINDOW_AGGREGATION={args.method} on the server as well, "
+              f"otherwise background refresh will redo these vectors with '{WINDOW_AGGREGATION}'")
+
+    if not database_url():
+        sys.exit("DATABASE_URL is not set")
+    app = create_db_app(__name__)
+    with app.app_context():
+        # Без --album/--playlist перераховується вся бібліотека рівня tier
+        track_ids = None
+        if args.album or args.playlist:
+            track_ids = _target_track_ids("album", args.album, args.tier) | _target_track_ids("playlist", args.playlist, args.tier)
+
+        updated = reaggregate_track_features(track_ids, tier=args.tier, method=args.method)
+        if not updated:
+            sys.exit("No tracks with stored window features")
+
+        for kind in ANALYSIS_TARGETS:
+            for target_id in sync_track_vectors_from_store(kind, updated if track_ids is not None else None, args.tier):
+                try:
+                    reanalyze_from_store(kind, target_id, args.tier)
+                except AnalysisError as e:
+                    print(f"❌ [ERROR] Cannot re-analyze {kind} {target_id}: {e}")
+
+
+if __name__ == "__main__":
+    main()
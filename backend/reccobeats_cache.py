@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime, timezone
+from flask import has_app_context
+from models import db, ChunkFeatureCache
+from bulk_upsert import upsert_rows
+
+# Скільки записів тримати; найдавніше використані видаляються
+CACHE_MAX_ENTRIES = int(os.getenv("RECCOBEATS_CACHE_MAX_ENTRIES", "50000"))
+EVICT_EVERY = 200  # перевіряти розмір кешу раз на стільки нових записів
+
+_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+_stats_lock = threading.Lock()
+_inserts_since_evict = 0
+
+
+def chunk_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def cache_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    return stats
+
+
+def get_cached_features(hashes):
+    """
+    Повертає {hash: np.array(9)} для вікон, відповідь на які вже є в кеші.
+    Без контексту застосунку (наприклад, у воркер-процесі) кеш не використовується.
+    """
+    if not hashes or not has_app_context():
+        return {}
+
+    try:
+        rows = ChunkFeatureCache.query.filter(ChunkFeatureCache.chunk_hash.in_(set(hashes))).all()
+        found = {row.chunk_hash: np.array(json.loads(row.features)) for row in rows}
+
+        if found:
+            ChunkFeatureCache.query.filter(ChunkFeatureCache.chunk_hash.in_(found.keys())).update(
+                {"last_used_at": datetime.now(timezone.utc)}, synchronize_session=False
+            )
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] Reccobeats cache lookup failed: {e}")
+        found = {}
+
+    hits = sum(1 for h in hashes if h in found)
+    _count("hits", hits)
+    _count("misses", len(hashes) - hits)
+    return found
+
+
+def store_features(features_by_hash):
+    """
+    Зберігає відповіді Reccobeats: {hash: np.array(9)}.
+    """
+    global _inserts_since_evict
+    if not features_by_hash or not has_app_context():
+        return
+
+    now = datetime.now(timezone.utc)
+    try:
+        # Те саме вікно міг паралельно зберегти інший потік — upsert просто перезапише його
+        upsert_rows(ChunkFeatureCache, [
+            {"chunk_hash": h, "features": json.dumps(np.asarray(feats).tolist()), "last_used_at": now}
+            for h, feats in features_by_hash.items()
+        ], ["chunk_hash"])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] Failed to store Reccobeats cache entries: {e}")
+        return
+
+    _count("stored", len(features_by_hash))
+    with _stats_lock:
+        _inserts_since_evict += len(features_by_hash)
+        should_evict = _inserts_since_evict >= EVICT_EVERY
+        if should_evict:
+            _inserts_since_evict = 0
+    if should_evict:
+        evict_least_recently_used()
+
+
+def evict_least_recently_used():
+    """
+    LRU-витіснення: залишає CACHE_MAX_ENTRIES найсвіжіше використаних записів.
+    """
+    try:
+        excess = ChunkFeatureCache.query.count() - CACHE_MAX_ENTRIES
+        if excess <= 0:
+            return
+
+        oldest = (
+            db.session.query(ChunkFeatureCache.chunk_hash)
+            .order_by(ChunkFeatureCache.last_used_at)
+            .limit(excess)
+            .subquery()
+        )
+        deleted = ChunkFeatureCache.query.filter(
+            ChunkFeatureCache.chunk_hash.in_(db.select(oldest.c.chunk_hash))
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        _count("evicted", deleted)
+        print(f"🗑️ [INFO] Evicted {deleted} Reccobeats cache entries")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] Reccobeats cache eviction failed: {e}")
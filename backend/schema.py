@@ -0,0 +1,167 @@
+import json
+from sqlalchemy import text, tuple_
+from models import db, AnalyzedAlbum, AlbumTrackFeature, AnalyzedPlaylist, PlaylistTrackFeature, TrackFeature
+from feature_vectors import pack_features
+from features_extractor import feature_params_hash
+from analysis_locks import advisory_lock
+
+# Скільки чекати, поки міграцію схеми завершить інший запуск (наприклад, паралельний деплой)
+SCHEMA_LOCK_TIMEOUT_SEC = 600
+
+# Колонки, додані до вже наявних таблиць; create_all їх не створює
+ADDED_COLUMNS = [
+    ("analyzed_playlist", "snapshot_id", "VARCHAR(128)"),
+    ("analyzed_playlist", "track_ids", "TEXT"),
+    ("analysis_job", "snapshot_id", "VARCHAR(128)"),
+    ("analyzed_album", "features_vec", "BYTEA"),
+    ("album_track_feature", "features_vec", "BYTEA"),
+    ("analyzed_playlist", "features_vec", "BYTEA"),
+    ("playlist_track_feature", "features_vec", "BYTEA"),
+    ("track_feature", "features_vec", "BYTEA"),
+    ("analyzed_album", "response_gz", "BYTEA"),
+    ("analyzed_album", "response_etag", "VARCHAR(64)"),
+    ("analyzed_playlist", "response_gz", "BYTEA"),
+    ("analyzed_playlist", "response_etag", "VARCHAR(64)"),
+    ("analyzed_album", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("album_track_feature", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("analyzed_playlist", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("playlist_track_feature", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("track_feature", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("analysis_job", "tier", "VARCHAR(16) NOT NULL DEFAULT 'standard'"),
+    ("track_feature", "window_features", "BYTEA"),
+    ("track_feature", "n_windows", "SMALLINT"),
+    # Рядки, збережені до появи версій, порахував старий конвеєр (MP3, усі вікна) — це версія 0,
+    # і фоновий перерахунок їх оновлює
+    ("track_feature", "extractor_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("analyzed_album", "extractor_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("analyzed_playlist", "extractor_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("analyzed_album", "view_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("analyzed_playlist", "view_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("track_feature", "feature_params", "VARCHAR(16)"),
+    ("analyzed_album", "feature_params", "VARCHAR(16)"),
+    ("analyzed_playlist", "feature_params", "VARCHAR(16)"),
+    ("track_feature", "high_level_backend", "VARCHAR(16)"),
+    ("analyzed_album", "high_level_backend", "VARCHAR(16)"),
+    ("analyzed_playlist", "high_level_backend", "VARCHAR(16)"),
+]
+
+FEATURE_PARAMS_TABLES = ["track_feature", "analyzed_album", "analyzed_playlist"]
+
+# Бекенд high-level фіч для рядків, збережених до появи колонки high_level_backend, відновлюється
+# з відбитка налаштувань. Рядки без відбитка (з часів до версій) рахувалися лише через Reccobeats;
+# рядки з невідомим відбитком лишаються NULL і не перевикористовуються
+BACKEND_BY_FEATURE_PARAMS = {
+    feature_params_hash(high_level_backend="reccobeats"): "reccobeats",
+    feature_params_hash(high_level_backend="local"): "local",
+}
+
+# Первинні ключі, змінені після створення таблиць (рівень якості став частиною ключа)
+PRIMARY_KEYS = [
+    ("analyzed_album", ["album_id", "tier"]),
+    ("album_track_feature", ["album_id", "track_id", "tier"]),
+    ("analyzed_playlist", ["playlist_id", "tier"]),
+    ("playlist_track_feature", ["playlist_id", "track_id", "tier"]),
+    ("track_feature", ["track_id", "tier"]),
+]
+
+# Таблиці, де вектори фіч переїхали з JSON-тексту у features_vec
+FEATURE_VECTOR_MODELS = [AnalyzedAlbum, AlbumTrackFeature, AnalyzedPlaylist, PlaylistTrackFeature, TrackFeature]
+MIGRATION_BATCH_SIZE = 500
+
+
+def migrate_feature_vectors():
+    """
+    Переносить JSON-вектори зі старої колонки features у упакований float32 features_vec
+    і очищує JSON. Повторний запуск нічого не робить для вже перенесених рядків.
+    Рядки, JSON яких не розбирається, лишаються з JSON і без features_vec (аналіз із таким
+    підсумком вважається відсутнім) — їх видно в логах, а дані не губляться.
+    """
+    for model in FEATURE_VECTOR_MODELS:
+        primary_key = tuple_(*model.__table__.primary_key.columns)
+        migrated = failed = 0
+        last_key = None
+        while True:
+            # Прохід за первинним ключем: рядки, що не перенеслися, не вибираються повторно
+            query = model.query.filter(model.features_vec.is_(None), model.features.isnot(None))
+            if last_key is not None:
+                query = query.filter(primary_key > tuple_(*last_key))
+            rows = query.order_by(*model.__table__.primary_key.columns).limit(MIGRATION_BATCH_SIZE).all()
+            if not rows:
+                break
+
+            for row in rows:
+                try:
+                    row.features_vec = pack_features(json.loads(row.features))
+                except Exception as e:
+                    print(f"❌ [ERROR] Cannot migrate features of {model.__tablename__} row, keeping JSON: {e}")
+                    failed += 1
+                    continue
+                row.features = None
+                migrated += 1
+            last_key = [getattr(rows[-1], column.key) for column in model.__table__.primary_key.columns]
+            db.session.commit()
+
+        if migrated:
+            print(f"🗄️ [INFO] Migrated {migrated} feature vector(s) in {model.__tablename__} to float32")
+        if failed:
+            print(f"⚠️ [WARN] {failed} row(s) in {model.__tablename__} kept JSON features that cannot be parsed")
+
+
+def _ensure_primary_key(table, columns):
+    current = db.session.execute(text("""
+        SELECT c.conname, array_agg(a.attname::text) AS columns
+        FROM pg_constraint c
+        JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+        WHERE c.conrelid = CAST(:table AS regclass) AND c.contype = 'p'
+        GROUP BY c.conname
+    """), {"table": table}).first()
+
+    if current is not None and set(current.columns) == set(columns):
+        return
+
+    drop = f"DROP CONSTRAINT {current.conname}, " if current is not None else ""
+    db.session.execute(text(f"ALTER TABLE {table} {drop}ADD PRIMARY KEY ({', '.join(columns)})"))
+    print(f"🗄️ [INFO] Primary key of {table} changed to ({', '.join(columns)})")
+
+
+def _column_exists(table, column):
+    return db.session.execute(text("""
+        SELECT 1 FROM information_schema.columns WHERE table_name = :table AND column_name = :column
+    """), {"table": table, "column": column}).first() is not None
+
+
+def ensure_schema():
+    """
+    Створює таблиці, яких ще немає в БД, додає нові колонки до наявних
+    і переносить дані у нові формати. Запускається окремою командою (migrate_schema.py)
+    перед стартом сервера; advisory-лок не дає двом запускам змінювати схему одночасно.
+    """
+    with advisory_lock("schema", timeout=SCHEMA_LOCK_TIMEOUT_SEC) as acquired:
+        if not acquired:
+            raise RuntimeError("Another schema migration is still running")
+        _ensure_schema_locked()
+
+
+def _ensure_schema_locked():
+    db.create_all()
+
+    backfill_params = [table for table in FEATURE_PARAMS_TABLES if not _column_exists(table, "feature_params")]
+    backfill_backend = [table for table in FEATURE_PARAMS_TABLES if not _column_exists(table, "high_level_backend")]
+    for table, column, column_type in ADDED_COLUMNS:
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}"))
+    for table in backfill_params:
+        # Рядки старші за відбиток налаштувань: версія 0 і відбиток NULL — вони застарілі,
+        # навіть якщо колонку версії вже додали зі старим значенням за замовчуванням
+        db.session.execute(text(f"UPDATE {table} SET extractor_version = 0, feature_params = NULL"))
+    for table in backfill_backend:
+        db.session.execute(text(f"UPDATE {table} SET high_level_backend = 'reccobeats' WHERE feature_params IS NULL"))
+        for params, backend in BACKEND_BY_FEATURE_PARAMS.items():
+            db.session.execute(
+                text(f"UPDATE {table} SET high_level_backend = :backend WHERE feature_params = :params"),
+                {"backend": backend, "params": params}
+            )
+    for table, columns in PRIMARY_KEYS:
+        _ensure_primary_key(table, columns)
+    db.session.commit()
+
+    migrate_feature_vectors()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модулі бекенду лежать пласко в backend/ — робимо їх імпортованими з тестів
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
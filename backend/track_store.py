@@ -0,0 +1,183 @@
+from models import db, TrackFeature
+from bulk_upsert import upsert_rows
+from analysis_tiers import DEFAULT_TIER
+from feature_vectors import pack_features, unpack_matrix, unpack_windows, features_to_list
+from window_aggregation import AGGREGATIONS, WINDOW_AGGREGATION, aggregate_windows
+from extraction_pool import extract_tracks_features
+from features_extractor import EXTRACTOR_VERSION, FEATURE_PARAMS, HIGH_LEVEL_BACKEND, feature_params_hash
+
+REAGGREGATE_BATCH_SIZE = 5000
+
+
+def load_track_features(track_ids, tier=DEFAULT_TIER):
+    """
+    Повертає {track_id: features} для треків, які вже аналізувались раніше на рівні tier
+    поточним бекендом high-level фіч (вектори іншого бекенду з ними не порівнювані).
+    """
+    if not track_ids:
+        return {}
+
+    rows = (
+        db.session.query(TrackFeature.track_id, TrackFeature.features_vec)
+        .filter(
+            TrackFeature.track_id.in_(track_ids),
+            TrackFeature.tier == tier,
+            TrackFeature.high_level_backend == HIGH_LEVEL_BACKEND,
+            TrackFeature.features_vec.isnot(None)
+        )
+        .all()
+    )
+    matrix = unpack_matrix([row.features_vec for row in rows])
+    return {row.track_id: features_to_list(features) for row, features in zip(rows, matrix)}
+
+
+def stored_provenance(track_ids, tier=DEFAULT_TIER):
+    """
+    Походження векторів треків у сховищі: (найстаріша версія екстрактора, відбиток налаштувань).
+    Відбиток "mixed", якщо вектори пораховані з різними налаштуваннями.
+    Треки, яких у сховищі немає, вважаються версією 0 з невідомим відбитком.
+    """
+    track_ids = set(track_ids)
+    if not track_ids:
+        return EXTRACTOR_VERSION, FEATURE_PARAMS
+
+    rows = (
+        db.session.query(TrackFeature.track_id, TrackFeature.extractor_version, TrackFeature.feature_params)
+        .filter(TrackFeature.track_id.in_(track_ids), TrackFeature.tier == tier)
+        .all()
+    )
+    if len(rows) < len(track_ids):
+        return 0, None
+
+    params = {row.feature_params for row in rows}
+    return min(row.extractor_version for row in rows), params.pop() if len(params) == 1 else "mixed"
+
+
+def save_track_features(extracted, tier=DEFAULT_TIER):
+    """
+    Зберігає щойно витягнуті фічі треків у спільне сховище разом з фічами окремих вікон.
+    extracted — список (track, features, window_features).
+    """
+    if not extracted:
+        return
+
+    # Паралельний запит міг уже зберегти ті самі треки — upsert просто перезапише їх
+    upsert_rows(TrackFeature, [
+        {
+            "track_id": track["id"],
+            "tier": tier,
+            "track_name": track["name"],
+            "artist_name": track["artists"][0]["name"],
+            "features_vec": pack_features(feats),
+            "window_features": pack_features(windows),
+            "n_windows": len(windows),
+            "extractor_version": EXTRACTOR_VERSION,
+            "feature_params": FEATURE_PARAMS,
+            "high_level_backend": HIGH_LEVEL_BACKEND,
+        }
+        for track, feats, windows in extracted
+    ], ["track_id", "tier"])
+    db.session.commit()
+    print(f"💾 [INFO] Stored features for {len(extracted)} new track(s)")
+
+
+def collect_tracks_features(tracks, on_track_done=None, known=None, tier=DEFAULT_TIER, analyze_missing=True):
+    """
+    Фічі для списку треків: спершу зі сховища, завантажуються й аналізуються
+    лише ті треки, яких там ще немає.
+    known — {track_id: features}, які вже відомі викликачу (наприклад, з попереднього
+    аналізу того самого плейлиста); для них сховище не запитується.
+    Використовуються лише вектори рівня tier, нові треки аналізуються на цьому ж рівні.
+    analyze_missing=False — лише збережені вектори: треки без них пропускаються, як невдалі.
+    on_track_done(track, features[, n_windows]) викликається для кожного готового треку
+    (n_windows передається лише для щойно проаналізованих треків).
+    Повертає список (track, features) для успішних треків у вихідному порядку.
+    """
+    stored = dict(known or {})
+    stored.update(load_track_features([track["id"] for track in tracks if track["id"] not in stored], tier))
+    missing = [track for track in tracks if track["id"] not in stored]
+    print(f"🗂️ [INFO] {len(stored)} track(s) found in feature store, {len(missing)} to analyze")
+    if not analyze_missing and missing:
+        print(f"⏭️ [INFO] Skipping {len(missing)} track(s) without stored {HIGH_LEVEL_BACKEND} features")
+        missing = []
+
+    if on_track_done:
+        for track in tracks:
+            if track["id"] in stored:
+                on_track_done(track, stored[track["id"]])
+
+    extracted = extract_tracks_features(missing, on_track_done=on_track_done, tier=tier)
+    save_track_features(extracted, tier)
+
+    features_by_id = dict(stored)
+    features_by_id.update((track["id"], feats) for track, feats, _ in extracted)
+
+    return [(track, features_by_id[track["id"]]) for track in tracks if track["id"] in features_by_id]
+
+
+def _reaggregated_params(row, method):
+    """
+    Відбиток рядка після зведення його вікон методом method. Бекенд береться з самого рядка,
+    а решта налаштувань — лише якщо відбиток рядка підтверджує, що вони збігаються з поточними
+    (перебираються всі способи зведення). None — налаштування рядка невідомі.
+    """
+    for aggregation in AGGREGATIONS:
+        known = feature_params_hash(high_level_backend=row.high_level_backend, window_aggregation=aggregation)
+        if known == row.feature_params:
+            return feature_params_hash(high_level_backend=row.high_level_backend, window_aggregation=method)
+    return None
+
+
+def reaggregate_track_features(track_ids=None, tier=DEFAULT_TIER, method=None, batch_size=REAGGREGATE_BATCH_SIZE):
+    """
+    Перераховує вектори треків зі збережених фіч вікон (без завантаження аудіо):
+    кожна пачка до batch_size треків зводиться одним векторизованим проходом.
+    track_ids = None — уся бібліотека рівня tier. Повертає id оновлених треків.
+    Треки, налаштування яких не вдається відновити з відбитка (інший поріг відбору вікон,
+    рядки до появи відбитка), не чіпаються — їх оновить фоновий перерахунок.
+    """
+    method = method or WINDOW_AGGREGATION
+    query = db.session.query(
+        TrackFeature.track_id,
+        TrackFeature.window_features,
+        TrackFeature.n_windows,
+        TrackFeature.high_level_backend,
+        TrackFeature.feature_params,
+    ).filter(
+        TrackFeature.tier == tier,
+        TrackFeature.window_features.isnot(None)
+    )
+    if track_ids is not None:
+        query = query.filter(TrackFeature.track_id.in_(track_ids))
+
+    updated = []
+    skipped = 0
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.filter(TrackFeature.track_id > last_id)
+        rows = batch_query.order_by(TrackFeature.track_id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].track_id
+
+        params = [_reaggregated_params(row, method) for row in rows]
+        known = [(row, row_params) for row, row_params in zip(rows, params) if row_params is not None]
+        skipped += len(rows) - len(known)
+        if not known:
+            continue
+
+        stacked = unpack_windows([row.window_features for row, _ in known], [row.n_windows for row, _ in known])
+        aggregated = aggregate_windows(stacked, method)
+        upsert_rows(TrackFeature, [
+            {"track_id": row.track_id, "tier": tier, "features_vec": pack_features(features), "feature_params": row_params}
+            for (row, row_params), features in zip(known, aggregated)
+        ], ["track_id", "tier"])
+        db.session.commit()
+
+        updated += [row.track_id for row, _ in known]
+
+    print(f"🧮 [INFO] Re-aggregated {len(updated)} {tier} track vector(s) from stored windows")
+    if skipped:
+        print(f"⚠️ [WARN] Skipped {skipped} track(s) whose feature settings differ from this environment "
+              f"or are unknown")
+    return updated
@@ -0,0 +1,45 @@
+import os
+import numpy as np
+
+# Частка крайніх значень, що відкидається з кожного боку для trimmed_mean
+TRIM_FRACTION = 0.2
+# Скільки вікон щонайменше відкидається з кожного боку, якщо вікон 3 і більше: при частці 0.2
+# floor(n * 0.2) = 0 для n <= 4, і trimmed_mean збігався б зі звичайним середнім
+TRIM_MIN_WINDOWS = 1
+
+
+def _trimmed_nanmean(stacked):
+    """
+    Середнє без TRIM_FRACTION (але не менше TRIM_MIN_WINDOWS, якщо вікон >= 3) найменших
+    і найбільших вікон кожної фічі (NaN — відсутні вікна). Для 3 вікон це медіана,
+    для 1-2 вікон — звичайне середнє.
+    """
+    ordered = np.sort(stacked, axis=1)  # NaN сортуються в кінець
+    valid = np.sum(~np.isnan(stacked), axis=1, keepdims=True)
+    trim = np.floor(valid * TRIM_FRACTION)
+    trim = np.where(valid >= 2 * TRIM_MIN_WINDOWS + 1, np.maximum(trim, TRIM_MIN_WINDOWS), trim)
+    positions = np.arange(stacked.shape[1])[np.newaxis, :, np.newaxis]
+    keep = (positions >= trim) & (positions < valid - trim)
+    with np.errstate(invalid="ignore"):
+        return np.where(keep, ordered, 0).sum(axis=1) / keep.sum(axis=1)
+
+
+# Способи звести вікна треку до одного вектора: stacked (n_tracks, max_windows, n_features) -> (n_tracks, n_features)
+AGGREGATIONS = {
+    "mean": lambda stacked: np.nanmean(stacked, axis=1),
+    "median": lambda stacked: np.nanmedian(stacked, axis=1),
+    "trimmed_mean": _trimmed_nanmean,
+}
+
+WINDOW_AGGREGATION = os.getenv("WINDOW_AGGREGATION", "mean")
+
+
+def aggregate_windows(stacked, method=None):
+    """
+    Зводить вікна всіх треків за один векторизований прохід.
+    stacked — (n_tracks, max_windows, n_features), відсутні вікна заповнені NaN.
+    """
+    method = method or WINDOW_AGGREGATION
+    if method not in AGGREGATIONS:
+        raise ValueError(f"Unknown window aggregation '{method}', expected one of: {', '.join(AGGREGATIONS)}")
+    return np.round(AGGREGATIONS[method](np.asarray(stacked, dtype=np.float64)), 4)
@@ -0,0 +1,46 @@
+CHUNK_LENGTH_MS = 30000
+N_WINDOWS = 3
+
+
+def plan_windows(duration_ms, chunk_length_ms=CHUNK_LENGTH_MS, n_windows=N_WINDOWS):
+    """
+    План вікон аналізу: n_windows (непарне) вікон по chunk_length_ms підряд навколо центру треку
+    (або весь трек, якщо він коротший за одне вікно).
+    Повертає список (start_ms, end_ms). Спільний для завантаження й нарізки.
+    """
+    if duration_ms <= chunk_length_ms:
+        return [(0, duration_ms)]
+
+    center = duration_ms // 2
+    offsets = [(i - n_windows // 2) * chunk_length_ms for i in range(n_windows)]
+
+    windows = []
+    for offset in offsets:
+        start = max(center + offset - chunk_length_ms // 2, 0)
+        end = min(start + chunk_length_ms, duration_ms)
+        windows.append((start, end))
+
+    return windows
+
+
+def windows_span(windows):
+    """
+    Один суцільний відрізок (start_ms, end_ms), що покриває всі вікна.
+    Відрізок симетричний відносно центру треку, тому plan_windows на вирізаному
+    файлі дає ті самі вікна, що й на повному треку.
+    """
+    return min(start for start, _ in windows), max(end for _, end in windows)
+
+
+def analysed_span(duration_ms, chunk_length_ms=CHUNK_LENGTH_MS, n_windows=N_WINDOWS):
+    """
+    Відрізок (start_ms, end_ms), який треба завантажити для аналізу, або None,
+    якщо потрібен весь трек (тривалість невідома або трек коротший за вікна).
+    """
+    if not duration_ms:
+        return None
+
+    start_ms, end_ms = windows_span(plan_windows(duration_ms, chunk_length_ms, n_windows))
+    if end_ms - start_ms >= duration_ms:
+        return None
+    return start_ms, end_ms
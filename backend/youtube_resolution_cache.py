@@ -0,0 +1,95 @@
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+from flask import has_app_context
+from models import db, YoutubeResolution
+from bulk_upsert import upsert_rows
+
+# Скільки днів довіряти знайденому відео (результати пошуку з часом змінюються)
+RESOLUTION_TTL = timedelta(days=float(os.getenv("YOUTUBE_RESOLUTION_TTL_DAYS", "30")))
+
+# Відео, закріплене вручну, діє для будь-якого пошукового запиту треку
+PINNED_QUERY = ""
+
+_stats = {"hits": 0, "misses": 0, "stored": 0, "invalidated": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, n=1):
+    with _stats_lock:
+        _stats[key] += n
+
+
+def resolution_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    return stats
+
+
+def get_resolved_video(track_id, query):
+    """
+    id відео YouTube для треку: закріплене вручну або раніше знайдене за цим запитом, інакше None.
+    Знайдені записи, старші за RESOLUTION_TTL, не використовуються.
+    """
+    if not track_id or not has_app_context():
+        return None
+
+    try:
+        rows = YoutubeResolution.query.filter(
+            YoutubeResolution.track_id == track_id,
+            YoutubeResolution.search_query.in_([query, PINNED_QUERY])
+        ).all()
+        expired_before = datetime.now(timezone.utc) - RESOLUTION_TTL
+        valid = [row for row in rows if row.pinned or row.created_at >= expired_before]
+        valid.sort(key=lambda row: not row.pinned)
+        video_id = valid[0].video_id if valid else None
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] YouTube resolution lookup failed: {e}")
+        video_id = None
+
+    _count("hits" if video_id else "misses")
+    return video_id
+
+
+def store_resolved_video(track_id, query, video_id, title=None, pinned=False):
+    if not track_id or not video_id or not has_app_context():
+        return
+
+    try:
+        upsert_rows(YoutubeResolution, [{
+            "track_id": track_id,
+            "search_query": query,
+            "video_id": video_id,
+            "title": title,
+            "pinned": pinned,
+            "created_at": datetime.now(timezone.utc),
+        }], ["track_id", "search_query"])
+        db.session.commit()
+        _count("stored")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ [ERROR] Failed to store YouTube resolution for {track_id}: {e}")
+
+
+def pin_resolved_video(track_id, video_id):
+    """
+    Вручну задає правильне відео для треку (замість невдалого збігу пошуку).
+    """
+    store_resolved_video(track_id, PINNED_QUERY, video_id, pinned=True)
+
+
+def invalidate_resolution(track_id, query=None):
+    """
+    Забуває знайдене відео треку (для всіх запитів, включно із закріпленим, або лише для query).
+    Повертає кількість видалених записів.
+    """
+    rows = YoutubeResolution.query.filter(YoutubeResolution.track_id == track_id)
+    if query is not None:
+        rows = rows.filter(YoutubeResolution.search_query == query)
+    deleted = rows.delete(synchronize_session=False)
+    db.session.commit()
+    _count("invalidated", deleted)
+    return deleted
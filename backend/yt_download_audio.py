@@ -1,54 +1,151 @@
 import os
 import re
-import time
+import threading
 import yt_dlp
+from window_plan import analysed_span
+from analysis_tiers import DEFAULT_TIER, get_tier
+from audio_cache import store_cached_audio
+from youtube_resolution_cache import get_resolved_video, store_resolved_video, invalidate_resolution
 
-def sanitize_filename(name):
-    return re.sub(r'[<>:"/\\|?*]', '_', name)
+FFMPEG_PATH = os.path.abspath("./ffmpeg/bin")
+# COOKIE_FILE = 'youtube_cookies.txt'   <--- для локальної розробки
+COOKIE_FILE = '/etc/secrets/youtube_cookies.txt' # <--- це я змінив на це перед деплоєм
 
-def download_audio(track_name, artist_name, out_dir="audio_temp"):
-    os.makedirs(out_dir, exist_ok=True)
+# Нативний аудіопотік без перекодування: opus (webm) або aac (m4a)
+NATIVE_FORMAT = 'bestaudio[acodec=opus]/bestaudio[ext=m4a]/bestaudio/best'
 
-    safe_track = sanitize_filename(track_name)
-    safe_artist = sanitize_filename(artist_name)
+# Помилки yt-dlp, після яких збережене відео треку вже не відкрити (видалене, приватне тощо)
+UNAVAILABLE_VIDEO_ERROR = re.compile(
+    r"video unavailable|is unavailable|not available|has been removed|private video|been terminated",
+    re.IGNORECASE
+)
 
-    search_query = f"{track_name} {artist_name} audio"
-    out_path = os.path.join(out_dir, f"{safe_track}_{safe_artist}")
-    out_file = out_path + ".mp3"
+_local = threading.local()
+
+def _analysed_sections(tier=DEFAULT_TIER):
+    """
+    Колбек download_ranges: завантажуємо лише відрізок, що покриває вікна аналізу рівня tier.
+    [{}] означає "весь трек" (тривалість невідома або трек короткий).
+    """
+    config = get_tier(tier)
+
+    def sections(info_dict, ydl):
+        duration_ms = int((info_dict.get("duration") or 0) * 1000)
+        span = analysed_span(duration_ms, config["chunk_length_ms"], config["n_windows"])
+        if span is None:
+            return [{}]
+        return [{"start_time": span[0] / 1000, "end_time": span[1] / 1000}]
+
+    return sections
 
-    ffmpeg_path = os.path.abspath("./ffmpeg/bin")
+def _get_native_downloader(out_dir, sections_only=True, tier=DEFAULT_TIER):
+    """
+    Налаштований YoutubeDL на потік (окремий для кожної конфігурації), який
+    перевикористовується між треками. YoutubeDL не потокобезпечний, тому інстанс
+    не ділиться між потоками; ідентифікатор потоку в імені файлу не дає потокам
+    перезаписати файли одне одного.
+    """
+    if not hasattr(_local, "ydls"):
+        _local.ydls = {}
+    config = (out_dir, sections_only, tier)
+    if config in _local.ydls:
+        return _local.ydls[config]
 
     ydl_opts = {
-        'format': 'bestaudio/best',
+        'format': NATIVE_FORMAT,
         'quiet': True,
         'noplaylist': True,
-        'outtmpl': out_path,
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '128',
-        }],
-        'ffmpeg_location': ffmpeg_path,
+        'outtmpl': os.path.join(out_dir, f"%(id)s_{threading.get_ident()}.%(ext)s"),
+        'ffmpeg_location': FFMPEG_PATH,
         'retries': 10,
         'sleep_interval': 1,
         'noprogress': True,
-        'nooverwrites': True,
+        'overwrites': True,
         'concurrent_fragment_downloads': 1,
-        # 'cookiefile': 'youtube_cookies.txt',   <--- для локальної розробки
-        'cookiefile': '/etc/secrets/youtube_cookies.txt' # <--- це я змінив на це перед деплоєм
+        'cookiefile': COOKIE_FILE,
     }
+    if sections_only:
+        ydl_opts['download_ranges'] = _analysed_sections(tier)
+
+    _local.ydls[config] = yt_dlp.YoutubeDL(ydl_opts)
+    return _local.ydls[config]
+
+def _resolved_video_info(ydl, track_id, search_query):
+    """
+    Info dict відео, раніше знайденого для треку, без пошуку (лише сторінка відео) або None.
+    Відео, яке видалили чи закрили, забувається. Інші помилки (мережа, ліміти YouTube)
+    передаються далі, а збіг лишається в кеші для наступної спроби.
+    """
+    video_id = get_resolved_video(track_id, search_query)
+    if not video_id:
+        return None
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([f"ytsearch1:{search_query}"])
-        time.sleep(0.5)  # дати ОС завершити обробку файлу
+        return ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
+    except yt_dlp.utils.DownloadError as e:
+        if not UNAVAILABLE_VIDEO_ERROR.search(str(e)):
+            raise
+        print(f"⚠️ [WARN] Cached video {video_id} for '{search_query}' is unavailable, searching again: {e}")
+        invalidate_resolution(track_id, search_query)
+        return None
 
-        if os.path.exists(out_file):
-            return out_file
-        else:
-            print(f"❌ File not found after download: {out_file}")
+def search_audio(track_name, artist_name, out_dir="audio_temp", sections_only=True, tier=DEFAULT_TIER, track_id=None):
+    """
+    Знаходить відео на YouTube без завантаження. Повертає info dict для download_resolved_audio
+    або None. Окремо від завантаження, щоб пошук наступного треку йшов паралельно.
+    track_id (Spotify id): знайдене відео запам'ятовується в БД, і повторний аналіз
+    того самого треку (в будь-якому альбомі/плейлисті) пропускає ytsearch.
+    """
+    search_query = f"{track_name} {artist_name} audio"
+    try:
+        ydl = _get_native_downloader(out_dir, sections_only, tier)
+        if track_id:
+            info = _resolved_video_info(ydl, track_id, search_query)
+            if info:
+                return info
+
+        info = ydl.extract_info(f"ytsearch1:{search_query}", download=False)
+        entries = info.get("entries") or [info]
+        if not entries or not entries[0]:
+            print(f"❌ Nothing found for {search_query}")
             return None
 
+        if track_id:
+            store_resolved_video(track_id, search_query, entries[0].get("id"), entries[0].get("title"))
+        return entries[0]
+
+    except Exception as e:
+        print(f"❌ Search failed for {search_query}: {e}")
+        return None
+
+def download_resolved_audio(info, out_dir="audio_temp", sections_only=True, tier=DEFAULT_TIER):
+    """
+    Завантажує рідний аудіопотік відео, знайденого search_audio. Повертає шлях до файлу або None.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        ydl = _get_native_downloader(out_dir, sections_only, tier)
+        # Як --load-info-json у yt-dlp: прибираємо результати попередньої обробки і завантажуємо
+        result = ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+        downloads = result.get("requested_downloads") or []
+        out_file = downloads[0].get("filepath") if downloads else None
+        if out_file and os.path.exists(out_file):
+            return out_file
+
+        print(f"❌ File not found after download: {out_file}")
+        return None
+
     except Exception as e:
-        print(f"❌ Download failed for {search_query}: {e}")
-        return None
\ No newline at end of file
+        print(f"❌ Download failed for {info.get('title') or info.get('id')}: {e}")
+        return None
+
+def cache_downloaded_audio(track_id, info, path, sections_only=True, tier=DEFAULT_TIER):
+    """
+    Зберігає щойно завантажений файл у кеш аудіо разом з тим, який відрізок треку він містить.
+    """
+    duration_ms = int((info.get("duration") or 0) * 1000)
+    span = None
+    if sections_only:
+        config = get_tier(tier)
+        span = analysed_span(duration_ms, config["chunk_length_ms"], config["n_windows"])
+    store_cached_audio(track_id, path, duration_ms, span)
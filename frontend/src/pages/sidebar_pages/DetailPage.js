@@ -7,6 +7,7 @@ import MediaList from "./components/MediaList";
 import MediaSidePanel from "./components/MediaSidePanel";
 import ItemOverview from "./components/ItemOverview";
 import { fetchLyrics } from "./utils/fetchLyrics";
+import { streamAnalysis, meanVector } from "./utils/fetchAnalysis";
 import StarRating from "./components/StarRating";
 import { useTranslation } from "react-i18next";
 
@@ -50,6 +51,29 @@ const DetailPage = () => {
       setIsAnalyzing(false);
     };
 
+    const runAnalysis = async (kind) => {
+      setIsAnalyzing(true);
+      const streamed = [];
+      const analysis = await streamAnalysis(kind, id, {
+        signal: controller.signal,
+        onTrack: (track) => {
+          if (!isMounted || !track.features) return;
+          // Проміжний результат: радар будується по вже готових треках
+          streamed.push(track);
+          setTrackFeatures([...streamed]);
+          setTrackNames(streamed.map((tr) => tr.track_name));
+          setMeanFeatures(meanVector(streamed.map((tr) => tr.features)));
+        },
+      });
+      if (!isMounted) return;
+      setMeanFeatures(analysis.feature_vector);
+      setConsistencyScore(analysis.consistency_score);
+      setTrackFeatures(analysis.track_features || []);
+      setTrackNames(analysis.track_names || []);
+      setTrackClusters(analysis.track_clusters || []);
+      setIsAnalyzing(false);
+    };
+
     const fetchAllData = async () => {
       try {
         resetState();
@@ -71,18 +95,7 @@ const DetailPage = () => {
           const albumTracks = tracksRes.data.items;
           setItems(albumTracks);
 
-          setIsAnalyzing(true);
-          const analysisRes = await axios.get(`https://mymusicmind-9gke.onrender.com/analyze_album/${id}`, {
-            withCredentials: true,
-            signal: controller.signal,
-          });
-          if (!isMounted) return;
-          setMeanFeatures(analysisRes.data.feature_vector);
-          setConsistencyScore(analysisRes.data.consistency_score);
-          setTrackFeatures(analysisRes.data.track_features || []);
-          setTrackNames(analysisRes.data.track_names || []);
-          setTrackClusters(analysisRes.data.track_clusters || []);
-          setIsAnalyzing(false);
+          await runAnalysis("album");
         } else if (type === "playlists") {
           tracksRes = await axios.get(`https://mymusicmind-9gke.onrender.com/${type}/${id}/tracks`, {
             withCredentials: true,
@@ -95,18 +108,7 @@ const DetailPage = () => {
             .slice(0, 50);
           setItems(playlistTracks);
 
-          setIsAnalyzing(true);
-          const analysisRes = await axios.get(`https://mymusicmind-9gke.onrender.com/analyze_playlist/${id}`, {
-            withCredentials: true,
-            signal: controller.signal,
-          });
-          if (!isMounted) return;
-          setMeanFeatures(analysisRes.data.feature_vector);
-          setConsistencyScore(analysisRes.data.consistency_score);
-          setTrackFeatures(analysisRes.data.track_features || []);
-          setTrackNames(analysisRes.data.track_names || []);
-          setTrackClusters(analysisRes.data.track_clusters || []);
-          setIsAnalyzing(false);
+          await runAnalysis("playlist");
         } else if (type === "artists") {
           tracksRes = await axios.get(`https://mymusicmind-9gke.onrender.com/${type}/${id}/top-tracks`, {
             withCredentials: true,
@@ -0,0 +1,75 @@
+import axios from "axios";
+
+const API_URL = "https://mymusicmind-9gke.onrender.com";
+const POLL_INTERVAL_MS = 3000;
+
+const wait = (ms, signal) =>
+  new Promise((resolve, reject) => {
+    const timer = setTimeout(resolve, ms);
+    signal?.addEventListener("abort", () => {
+      clearTimeout(timer);
+      reject(new axios.Cancel("Polling aborted"));
+    });
+  });
+
+// Аналіз альбому/плейлиста: кешований результат приходить одразу (200),
+// інакше бекенд ставить фонову задачу (202) і ми опитуємо її до завершення.
+// tier — рівень якості аналізу: fast, standard (за замовчуванням) або full.
+export const fetchAnalysis = async (kind, id, { signal, onProgress, tier } = {}) => {
+  const res = await axios.get(`${API_URL}/analyze_${kind}/${id}`, {
+    withCredentials: true,
+    params: tier ? { tier } : undefined,
+    signal,
+  });
+  if (res.status !== 202) return res.data;
+
+  let job = res.data;
+  while (job.state !== "done") {
+    if (job.state === "failed") {
+      throw new Error(job.error || "Analysis failed");
+    }
+    onProgress?.(job.progress);
+    await wait(POLL_INTERVAL_MS, signal);
+    const jobRes = await axios.get(`${API_URL}/analysis_jobs/${job.job_id}`, {
+      withCredentials: true,
+      signal,
+    });
+    job = jobRes.data;
+  }
+  return job.result;
+};
+
+// Потокова версія: фічі кожного треку приходять через server-sent events, щойно
+// трек проаналізовано (onTrack), а кластери й середній вектор — у фінальному summary.
+// Якщо з'єднання обірвалось, дочікуємось результату звичайним опитуванням.
+export const streamAnalysis = (kind, id, { signal, onTrack, onProgress, tier } = {}) =>
+  new Promise((resolve, reject) => {
+    const query = tier ? `?tier=${encodeURIComponent(tier)}` : "";
+    const source = new EventSource(`${API_URL}/analyze_${kind}/${id}/stream${query}`, {
+      withCredentials: true,
+    });
+
+    signal?.addEventListener("abort", () => {
+      source.close();
+      reject(new axios.Cancel("Stream aborted"));
+    });
+
+    source.addEventListener("track", (e) => onTrack?.(JSON.parse(e.data)));
+    source.addEventListener("summary", (e) => {
+      source.close();
+      resolve(JSON.parse(e.data));
+    });
+    source.addEventListener("error", (e) => {
+      source.close();
+      if (signal?.aborted) return;
+      // Подія error від бекенду має data, мережеві помилки EventSource — ні
+      if (e.data) {
+        reject(new Error(JSON.parse(e.data).error || "Analysis failed"));
+      } else {
+        fetchAnalysis(kind, id, { signal, onProgress, tier }).then(resolve, reject);
+      }
+    });
+  });
+
+export const meanVector = (vectors) =>
+  vectors[0].map((_, idx) => vectors.reduce((sum, v) => sum + v[idx], 0) / vectors.length);